@@ -0,0 +1,134 @@
+###############################################################################
+## Description: Runs the <Formula> fields of the ASDiv corpus through        ##
+##              ExpressionEvaluator in bulk. The left-hand side of each      ##
+##              formula is normalized into the evaluator's grammar, and the  ##
+##              eval_steps, operator counts and operand counts are produced  ##
+##              in parallel and stored by problem ID. Formulas that cannot   ##
+##              be normalized or evaluated, or whose value contradicts their ##
+##              own right-hand side, are reported with their IDs.            ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import json
+import re
+from fractions import Fraction
+from ASDivLoader import ASDivLoader
+from ExpressionEvaluator import ExpressionEvaluator
+from ExpressionTokenizer import tokenize, render, UNSUPPORTED_CHAR_REGEX
+from DatasetWriter import to_record
+from RationalEvaluator import RationalEvaluator
+
+# Parenthesized annotations such as "(g)", "(min/hour)", "(Jared)" or "(Lisa's team)";
+# variable groups like "(x-10+5)" are left alone so those formulas are rejected
+UNIT_ANNOTATION_REGEX = re.compile(r"\s*\(\s*[A-Za-z][A-Za-z'\.\s]*(?:/[A-Za-z]+)?\s*\)")
+# Juxtaposition meaning multiplication: "3(4+5)", "(2+1)(3+1)", "(2+1)3"
+IMPLICIT_MULTIPLY_REGEX = re.compile(r"(?<=[\d\.\)])(?=\()|(?<=\))(?=[\d\.])")
+# Right-hand sides: a number with an optional unit word, or "quotient r remainder"
+RESULT_REGEX = re.compile(r"\s*(-?\d+(?:\.\d+)?|-?\.\d+)(?:\s+[A-Za-z][A-Za-z\s]*)?\s*$")
+REMAINDER_REGEX = re.compile(r"\s*\d+\s*r\s*\d+\s*$")
+
+def normalize_expression(expression_str, rational_eval=None):
+    """Rewrite one side of an ASDiv formula in the evaluator's grammar, spaced
+    like ExpressionGenerator's output. Raises ValueError if it cannot be."""
+    expression_str = UNIT_ANNOTATION_REGEX.sub("", expression_str)
+    expression_str = re.sub(r"\s+", "", expression_str)
+    expression_str = IMPLICIT_MULTIPLY_REGEX.sub("*", expression_str)
+    unsupported = UNSUPPORTED_CHAR_REGEX.findall(expression_str)
+    if unsupported:
+        raise ValueError(f"Unsupported characters {''.join(sorted(set(unsupported)))!r} in {expression_str!r}")
+    if not re.search(r"(?<=[\d\.\)])[\^\*/\+\-]", expression_str):
+        raise ValueError(f"No operation to evaluate in {expression_str!r}")
+    rational_eval = rational_eval if rational_eval is not None else RationalEvaluator()
+    # Raises ValueError for malformed expressions (unbalanced parentheses, ...)
+    if rational_eval.evaluate(expression_str) is None:
+        raise ValueError(f"Undefined result for {expression_str!r}")
+    return render(tokenize(expression_str), 1)
+
+def parse_result(result_str):
+    """Exact value and number of decimal places of the right-hand side of a
+    formula clause: a number, with an optional unit ("60 (min)", "198 cents").
+    Raises ValueError for anything else, notably quotient-and-remainder
+    results such as "7 r5"."""
+    result_str = UNIT_ANNOTATION_REGEX.sub("", result_str)
+    if REMAINDER_REGEX.match(result_str):
+        raise ValueError(f"Quotient and remainder result {result_str.strip()!r} is not a value")
+    match = RESULT_REGEX.match(result_str)
+    if match is None:
+        raise ValueError(f"Result {result_str.strip()!r} is not a number")
+    number_str = match.group(1)
+    return Fraction(number_str), len(number_str.partition(".")[2])
+
+def normalize_formula(formula, rational_eval=None):
+    """Return the normalized left-hand side of the last equation in a formula
+    (clauses are separated by ';'), the one giving the answer. Raises
+    ValueError if it cannot be normalized or if its value does not match the
+    clause's right-hand side, rounded to the digits written there."""
+    clauses = [clause for clause in formula.split(";") if "=" in clause]
+    if not clauses:
+        raise ValueError(f"No equation in formula {formula!r}")
+    rational_eval = rational_eval if rational_eval is not None else RationalEvaluator()
+    lhs, rhs = clauses[-1].split("=")[:2]
+    expression_str = normalize_expression(lhs, rational_eval)
+    result, decimals = parse_result(rhs)
+    value = rational_eval.evaluate(expression_str)
+    # The written result may be rounded: allow half a unit of its last digit
+    if abs(value - result) > Fraction(1, 2 * 10 ** decimals):
+        raise ValueError(f"{expression_str!r} evaluates to {float(value)}, not to the result {float(result)}")
+    return expression_str
+
+class ASDivFormulaProcessor:
+    def __init__(self, loader=None, whitespace_amount=1, engine="string"):
+        self.loader = loader if loader is not None else ASDivLoader()
+        self.whitespace_amount = whitespace_amount
+        self.engine = engine
+        # Problem ID -> processed record, and problem ID -> error message
+        self.results = {}
+        self.failures = {}
+    def normalize_all(self, problems):
+        """Normalize the formula of every problem, returning {problem ID:
+        expression} and recording the problems that fail."""
+        rational_eval = RationalEvaluator()
+        expressions = {}
+        for problem_id, problem in problems.items():
+            try:
+                expressions[problem_id] = normalize_formula(problem["Formula"] or "", rational_eval)
+            except ValueError as error:
+                self.failures[problem_id] = f"{type(error).__name__}: {error}"
+        return expressions
+    def process(self, problems=None, num_workers=1, chunk_size=64):
+        """Produce eval_steps and counts for every problem (default: the whole
+        corpus) whose formula could be normalized. Returns (results, failures),
+        both keyed by problem ID."""
+        problems = problems if problems is not None else self.loader.load()
+        expressions = self.normalize_all(problems)
+        evaluator = ExpressionEvaluator(expressions, self.whitespace_amount, engine=self.engine)
+        processed_dataset = evaluator.process_dataset(num_workers=num_workers, chunk_size=chunk_size)
+        for problem_id, expression_str in expressions.items():
+            if expression_str in evaluator.failed_samples:
+                self.failures[problem_id] = evaluator.failed_samples[expression_str]
+            else:
+                self.results[problem_id] = {"formula": problems[problem_id]["Formula"],
+                                            **to_record(expression_str, processed_dataset[expression_str])}
+        return self.results, self.failures
+    def write(self, path, failures_path=None):
+        """Write one JSON object per processed problem, and the failures as a
+        JSON object mapping problem ID to error message."""
+        with open(path, "w", encoding="utf-8") as file:
+            for problem_id, record in self.results.items():
+                file.write(json.dumps({"problem_id": problem_id, **record}) + "\n")
+        with open(failures_path or path + ".failures.json", "w", encoding="utf-8") as file:
+            json.dump(self.failures, file, indent=2)
+
+
+def main():
+    processor = ASDivFormulaProcessor(ASDivLoader("ASDiv.xml"))
+    results, failures = processor.process(num_workers=4)
+    print("Processed formulas:", len(results))
+    print("Failed formulas:", len(failures))
+    for problem_id in list(results)[:3]:
+        print(problem_id, results[problem_id]["expression"], "->", results[problem_id]["eval_steps"])
+    for problem_id in list(failures)[:5]:
+        print(problem_id, failures[problem_id])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+###############################################################################
+## Description: Loads the ASDiv math word problem corpus (ASDiv.xml) by      ##
+##              streaming its <Problem> records with iterparse, builds       ##
+##              indexes by Grade and Solution-Type, and keeps a binary cache ##
+##              of the result that is invalidated when the XML file changes  ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import os
+import pickle
+import xml.etree.ElementTree as ET
+
+# Bump when the cached layout changes so stale caches are rebuilt
+CACHE_VERSION = 1
+PROBLEM_FIELDS = ("Body", "Question", "Solution-Type", "Answer", "Formula")
+
+class ASDivLoader:
+    def __init__(self, xml_path="ASDiv.xml", cache_path=None):
+        self.xml_path = xml_path
+        self.cache_path = cache_path if cache_path is not None else xml_path + ".cache.pkl"
+        self.problems = None
+        self.by_grade = None
+        self.by_solution_type = None
+    def __file_signature(self):
+        stat = os.stat(self.xml_path)
+        return (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    def __parse(self):
+        """Stream the <Problem> records, clearing each element once it has been read."""
+        problems = {}
+        for __, element in ET.iterparse(self.xml_path, events=("end",)):
+            if element.tag != "Problem":
+                continue
+            problem = {"Grade": element.get("Grade"), "Source": element.get("Source")}
+            for field in PROBLEM_FIELDS:
+                problem[field] = element.findtext(field)
+            problems[element.get("ID")] = problem
+            element.clear()
+        return problems
+    def __build_indexes(self):
+        self.by_grade = {}
+        self.by_solution_type = {}
+        for problem_id, problem in self.problems.items():
+            self.by_grade.setdefault(problem["Grade"], []).append(problem_id)
+            self.by_solution_type.setdefault(problem["Solution-Type"], []).append(problem_id)
+    def __read_cache(self, signature):
+        try:
+            with open(self.cache_path, "rb") as cache_file:
+                cached = pickle.load(cache_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if cached.get("signature") != signature:
+            return False
+        self.problems = cached["problems"]
+        self.by_grade = cached["by_grade"]
+        self.by_solution_type = cached["by_solution_type"]
+        return True
+    def __write_cache(self, signature):
+        cached = {"signature": signature, "problems": self.problems,
+                  "by_grade": self.by_grade, "by_solution_type": self.by_solution_type}
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as cache_file:
+                pickle.dump(cached, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # A read-only location only costs the speedup on the next load
+            pass
+    def load(self, use_cache=True):
+        """Return a dict mapping problem IDs to their fields (Grade, Source,
+        Body, Question, Solution-Type, Answer, Formula), using the cache when
+        it is newer than the XML file."""
+        if self.problems is not None:
+            return self.problems
+        signature = self.__file_signature()
+        if use_cache and self.__read_cache(signature):
+            return self.problems
+        self.problems = self.__parse()
+        self.__build_indexes()
+        if use_cache:
+            self.__write_cache(signature)
+        return self.problems
+    def query(self, grade=None, solution_type=None):
+        """Return the problems (ID -> fields) matching the given Grade and/or Solution-Type."""
+        self.load()
+        if grade is None and solution_type is None:
+            return dict(self.problems)
+        problem_ids = None
+        if grade is not None:
+            problem_ids = self.by_grade.get(str(grade), [])
+        if solution_type is not None:
+            type_ids = self.by_solution_type.get(solution_type, [])
+            if problem_ids is None:
+                problem_ids = type_ids
+            else:
+                type_ids = set(type_ids)
+                problem_ids = [problem_id for problem_id in problem_ids if problem_id in type_ids]
+        return {problem_id: self.problems[problem_id] for problem_id in problem_ids}
+
+
+def main():
+    loader = ASDivLoader("ASDiv.xml")
+    problems = loader.load()
+    print("Number of problems:", len(problems))
+    for grade, problem_ids in sorted(loader.by_grade.items()):
+        print(f"Grade {grade}: {len(problem_ids)} problems")
+    print("Grade 1 addition problems:", len(loader.query(grade=1, solution_type="Addition")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+###############################################################################
+## Description: Reproducible benchmark harness for the dataset pipeline.     ##
+##              Measures throughput and latency percentiles of               ##
+##              ExpressionGenerator.generate_dataset (max_nesting 2-5),      ##
+##              PrecedenceEvaluator.next_subexpression (by expression        ##
+##              length), ExpressionEvaluator.process_sample and              ##
+##              process_dataset with fixed seeds, and writes them to JSON so ##
+##              runs of different versions can be compared for regressions.  ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from DatasetGenerator import ExpressionGenerator
+from PrecedenceEvaluator import PrecedenceEvaluator
+from ExpressionEvaluator import ExpressionEvaluator
+
+PERCENTILES = (50, 90, 99)
+
+def summarize(name, params, latencies, num_items=None):
+    """Summarize per-call latencies (seconds) as a result record. num_items is
+    the number of items processed in total, when calls handle several each."""
+    latencies = np.asarray(latencies, dtype=float)
+    total = float(latencies.sum())
+    num_items = len(latencies) if num_items is None else num_items
+    return {"name": name,
+            "params": params,
+            "calls": len(latencies),
+            "items": num_items,
+            "total_s": total,
+            "throughput_per_s": num_items / total if total > 0 else None,
+            "latency_s": {"mean": float(latencies.mean()),
+                          **{f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES},
+                          "max": float(latencies.max())}}
+
+def time_calls(function, inputs):
+    """Call function on each input, returning the latency of every call."""
+    latencies = []
+    for value in inputs:
+        start = time.perf_counter()
+        function(value)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def make_dataset(num_samples, max_nesting, seed):
+    """Fixed-seed dataset of expressions used as input by the evaluator benchmarks."""
+    generator = ExpressionGenerator(num_samples=num_samples, min_value=0, max_value=100, max_nesting=max_nesting)
+    return dict(enumerate(generator.generate_iter(rng=seed)))
+
+def bench_generate_dataset(num_samples, repeats, seed, nesting_levels=(2, 3, 4, 5)):
+    results = []
+    for max_nesting in nesting_levels:
+        latencies = []
+        for repeat in range(repeats):
+            # generate_dataset draws from NumPy's global random state
+            np.random.seed(seed + repeat)
+            generator = ExpressionGenerator(num_samples=num_samples, min_value=0, max_value=100,
+                                            max_nesting=max_nesting)
+            latencies.extend(time_calls(lambda __: generator.generate_dataset(), [None]))
+        results.append(summarize("generate_dataset", {"max_nesting": max_nesting, "num_samples": num_samples},
+                                 latencies, num_samples * repeats))
+    return results
+
+def bench_next_subexpression(samples_per_length, seed, lengths=(16, 32, 64, 128, 256, 512)):
+    """Time next_subexpression on the first step of expressions whose length
+    (spaces removed, as the evaluator passes them) is in [length, 2*length)."""
+    rng = np.random.default_rng(seed)
+    generator = ExpressionGenerator(min_value=0, max_value=100, max_nesting=6)
+    buckets = {length: [] for length in lengths}
+    # Bounded search so a bucket that cannot be filled does not loop forever
+    for __ in range(200):
+        for expression in generator.generate_batch(1024, rng):
+            expression = expression.replace(" ", "")
+            for length in lengths:
+                if length <= len(expression) < 2 * length and len(buckets[length]) < samples_per_length:
+                    buckets[length].append(expression)
+        if all(len(bucket) >= samples_per_length for bucket in buckets.values()):
+            break
+    precedence_eval = PrecedenceEvaluator()
+    return [summarize("next_subexpression", {"min_length": length, "max_length": 2 * length - 1},
+                      time_calls(precedence_eval.locate, bucket))
+            for length, bucket in buckets.items() if bucket]
+
+def bench_process_sample(raw_dataset, engines=("string", "tree")):
+    results = []
+    for engine in engines:
+        evaluator = ExpressionEvaluator({}, whitespace_amount=1, engine=engine)
+        results.append(summarize("process_sample", {"engine": engine, "num_samples": len(raw_dataset)},
+                                 time_calls(evaluator.process_sample, raw_dataset.values())))
+    return results
+
+def bench_process_dataset(raw_dataset, repeats, num_workers=1, engines=("string", "tree")):
+    results = []
+    for engine in engines:
+        latencies = []
+        for __ in range(repeats):
+            # A fresh evaluator per run so every run starts with a cold cache
+            evaluator = ExpressionEvaluator(raw_dataset, whitespace_amount=1, engine=engine)
+            latencies.extend(time_calls(lambda __: evaluator.process_dataset(num_workers=num_workers), [None]))
+        results.append(summarize("process_dataset", {"engine": engine, "num_samples": len(raw_dataset),
+                                                     "num_workers": num_workers},
+                                 latencies, len(raw_dataset) * repeats))
+    return results
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": sys.version.split()[0], "numpy": np.__version__,
+            "platform": platform.platform(), "git_commit": commit}
+
+def run_benchmarks(num_samples=1000, repeats=3, seed=0, num_workers=1):
+    raw_dataset = make_dataset(num_samples, max_nesting=3, seed=seed)
+    results = []
+    results += bench_generate_dataset(num_samples, repeats, seed)
+    results += bench_next_subexpression(max(num_samples // 10, 10), seed)
+    results += bench_process_sample(raw_dataset)
+    results += bench_process_dataset(raw_dataset, repeats, num_workers)
+    return {"environment": environment_info(),
+            "config": {"num_samples": num_samples, "repeats": repeats, "seed": seed, "num_workers": num_workers},
+            "results": results}
+
+def result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+def compare(report, baseline, tolerance=0.10):
+    """Return (name, params, ratio) for every benchmark whose throughput fell
+    by more than tolerance relative to the baseline report."""
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        previous = baseline_results.get(result_key(result))
+        if previous is None or not previous["throughput_per_s"] or not result["throughput_per_s"]:
+            continue
+        ratio = result["throughput_per_s"] / previous["throughput_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append((result["name"], result["params"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dataset generation and evaluation.")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON report")
+    parser.add_argument("--num-samples", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-workers", type=int, default=1, help="workers for process_dataset")
+    parser.add_argument("--baseline", help="earlier JSON report to check for throughput regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.num_samples, args.repeats, args.seed, args.num_workers)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    for result in report["results"]:
+        print(f"{result['name']:<20} {json.dumps(result['params']):<60} "
+              f"{result['throughput_per_s']:>12.1f}/s  p50 {result['latency_s']['p50'] * 1e3:.3f} ms  "
+              f"p99 {result['latency_s']['p99'] * 1e3:.3f} ms")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for name, params, ratio in regressions:
+            print(f"REGRESSION {name} {json.dumps(params)}: {ratio:.2f}x baseline throughput")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+###############################################################################
+## Description: Defines a bounded-memory probabilistic set used to filter    ##
+##              duplicate expressions out of very large generation runs     ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import hashlib
+import math
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=1e-6):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Optimal number of bits and hash functions for the requested
+        # capacity and false positive rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.__bits = bytearray((self.num_bits + 7) // 8)
+        self.__num_items = 0
+    def __bit_positions(self, item):
+        """Derive the bit positions of an item using double hashing on a single digest."""
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    def add(self, item):
+        """Add an item to the filter. Returns False if the item was (probably) already present."""
+        is_new = False
+        for position in self.__bit_positions(item):
+            byte_idx, bit_mask = position >> 3, 1 << (position & 7)
+            if not self.__bits[byte_idx] & bit_mask:
+                self.__bits[byte_idx] |= bit_mask
+                is_new = True
+        if is_new:
+            self.__num_items += 1
+        return is_new
+    def __contains__(self, item):
+        return all(self.__bits[position >> 3] & (1 << (position & 7))
+                   for position in self.__bit_positions(item))
+    def __len__(self):
+        """Number of distinct items added (false positives are not counted)."""
+        return self.__num_items
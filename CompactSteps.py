@@ -0,0 +1,75 @@
+###############################################################################
+## Description: Defines a compact, delta-encoded representation of the      ##
+##              eval_steps of a processed expression: the original string   ##
+##              plus one (start, end, replacement) edit per step, stored in  ##
+##              flat arrays. Step strings are rebuilt lazily on access.      ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+from array import array
+from collections.abc import Mapping
+from itertools import accumulate
+
+def diff_edit(previous, current):
+    """Return the single (start, end, replacement) edit turning previous into current,
+    found by trimming their common prefix and suffix."""
+    max_prefix = min(len(previous), len(current))
+    start = 0
+    while start < max_prefix and previous[start] == current[start]:
+        start += 1
+    max_suffix = max_prefix - start
+    suffix = 0
+    while suffix < max_suffix and previous[-1 - suffix] == current[-1 - suffix]:
+        suffix += 1
+    return start, len(previous) - suffix, current[start:len(current) - suffix]
+
+class CompactSteps(Mapping):
+    """Read-only mapping from step index to step string, like the eval_steps
+    dict produced by ExpressionEvaluator, so it can be used in its place."""
+    def __init__(self, original, starts=(), ends=(), replacements=()):
+        self.original = original
+        self.__starts = array("I", starts)
+        self.__ends = array("I", ends)
+        self.__replacement_text = "".join(replacements)
+        self.__replacement_offsets = array("I", accumulate((len(replacement) for replacement in replacements), initial=0))
+        # Most recently rebuilt step, so sequential access costs one edit per step
+        self.__cached_index = -1
+        self.__cached_step = original
+    @classmethod
+    def from_steps(cls, original, eval_steps):
+        """Delta-encode an eval_steps dict (or list of step strings) against the original expression."""
+        steps = eval_steps.values() if isinstance(eval_steps, Mapping) else eval_steps
+        starts, ends, replacements = [], [], []
+        previous = original
+        for step in steps:
+            start, end, replacement = diff_edit(previous, step)
+            starts.append(start)
+            ends.append(end)
+            replacements.append(replacement)
+            previous = step
+        return cls(original, starts, ends, replacements)
+    def edit(self, index):
+        """The (start, end, replacement) edit applied to reach step index from the step before it."""
+        replacement = self.__replacement_text[self.__replacement_offsets[index]:self.__replacement_offsets[index + 1]]
+        return self.__starts[index], self.__ends[index], replacement
+    def edits(self):
+        """Flat edit columns (starts, ends, replacements), e.g. for serialization."""
+        return (list(self.__starts), list(self.__ends),
+                [self.edit(index)[2] for index in range(len(self))])
+    def __len__(self):
+        return len(self.__starts)
+    def __iter__(self):
+        return iter(range(len(self)))
+    def __getitem__(self, index):
+        if not isinstance(index, int) or not 0 <= index < len(self):
+            raise KeyError(index)
+        if index < self.__cached_index:
+            self.__cached_index, self.__cached_step = -1, self.original
+        step = self.__cached_step
+        for i in range(self.__cached_index + 1, index + 1):
+            start, end, replacement = self.edit(i)
+            step = step[:start] + replacement + step[end:]
+        self.__cached_index, self.__cached_step = index, step
+        return step
+    def __repr__(self):
+        return f"CompactSteps({self.original!r}, {len(self)} steps)"
@@ -1,14 +1,32 @@
 ###############################################################################
 ## Decription: Generates a dataset of integer arithmetic expressions to be   ##
 ##             evaluated for an LLM                                          ##
-## Last Modified: 11 March 2024                                              ##
+## Last Modified: 17 October 2026                                            ##
 ###############################################################################
 
+import time
+from fractions import Fraction
 import numpy as np
-import sympy as sp
+from BloomFilter import BloomFilter
+from RationalEvaluator import RationalEvaluator
+
+class RandomBlock:
+    """Hands out integers drawn in large vectorized blocks, drawing a new block when exhausted."""
+    def __init__(self, draw, block_size):
+        self.__draw = draw
+        self.__block_size = block_size
+        self.__values = []
+        self.__pos = 0
+    def next(self):
+        if self.__pos >= len(self.__values):
+            self.__values = self.__draw(self.__block_size).tolist()
+            self.__pos = 0
+        value = self.__values[self.__pos]
+        self.__pos += 1
+        return value
 
 class ExpressionGenerator:
-    def __init__(self, num_samples=100, min_value=1, max_value=100, operators=['*', '/', '+', '-'], max_nesting=3):
+    def __init__(self, num_samples=100, min_value=1, max_value=100, operators=['*', '/', '+', '-'], max_nesting=3, cross_check=False, stats=None):
         self.num_samples = num_samples
         self.min_value = min_value
         self.max_value = max_value
@@ -16,6 +34,13 @@ class ExpressionGenerator:
         self.max_nesting = max_nesting
         # self.precedence = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
         self.precedence = {'+': 1, '-': 1, '*': 2, '/': 2}
+        self.rational_eval = RationalEvaluator()
+        # When set, every accepted expression is also evaluated with sympy
+        # to verify the rational evaluator (slow; for debugging only)
+        self.cross_check = cross_check
+        # Optional PipelineStats collecting rejections, stage timings and
+        # expression lengths
+        self.stats = stats
     def generate_operand(self):
         """Generate a single operand within the specified range."""
         return str(np.random.randint(self.min_value, self.max_value))
@@ -52,25 +77,240 @@ class ExpressionGenerator:
                 expression += self.generate_operand()
             prev_operator = current_operator
         return expression
-    def generate_dataset(self):
-        """Generates a dictionary containing indexed arithmetic expressions."""
-        dataset = {}
+    def __assemble_expression(self, blocks, nesting_level=0, prev_operator=None):
+        """Build an expression exactly as generate_expression does, taking every random choice from pre-drawn blocks."""
+        arities, operators, coins, operands = blocks
+        if nesting_level >= self.max_nesting:
+            return str(operands.next())
+        parts = []
+        for i in range(arities.next()):
+            current_operator = self.operators[operators.next()] if i > 0 else None
+            if i > 0:
+                parts.append(f" {current_operator} ")
+            if nesting_level + 1 < self.max_nesting and coins.next():
+                sub_expr = self.__assemble_expression(blocks, nesting_level + 1, current_operator)
+                if i > 0 and self.needs_parentheses(prev_operator, current_operator, i < 2):
+                    parts.append(f"({sub_expr})")
+                else:
+                    parts.append(sub_expr)
+            else:
+                parts.append(str(operands.next()))
+            prev_operator = current_operator
+        return "".join(parts)
+    def generate_batch(self, n, rng=None):
+        """Generate n candidate expressions (not yet checked for validity or duplicates).
+
+        All arities, operators, nesting coins and operands are drawn in a few
+        vectorized calls on a np.random.Generator instead of one NumPy call per
+        choice. rng may be a Generator or a seed; a fixed seed gives a
+        reproducible batch.
+        """
+        rng = np.random.default_rng(rng)
+        # Size blocks for a typical batch; they are topped up if a batch of
+        # deeply nested expressions needs more draws
+        block_size = max(1024, n * 3 ** min(self.max_nesting, 3))
+        blocks = (RandomBlock(lambda size: rng.integers(2, 4, size), block_size),
+                  RandomBlock(lambda size: rng.integers(0, len(self.operators), size), block_size),
+                  RandomBlock(lambda size: rng.integers(0, 2, size), block_size),
+                  RandomBlock(lambda size: rng.integers(self.min_value, self.max_value, size), block_size))
+        return [self.__assemble_expression(blocks) for __ in range(n)]
+    def __fold_part(self, state, operator, atoms, operators, exact_division):
+        """Fold a part (its flat atom values and operators) into the running
+        (total, term, sign) state of the expression it is appended to with
+        operator, following * / before + - and left associativity. Returns the
+        new state, or None if this places a division by zero (or an inexact
+        division when exact_division is set)."""
+        total, term, sign = state
+        for operator, atom in zip((operator, *operators), atoms):
+            if operator == '*':
+                term *= atom
+            elif operator == '/':
+                if atom == 0:
+                    return None
+                # Kept as an int whenever the division is exact
+                if type(term) is int and type(atom) is int and term % atom == 0:
+                    term //= atom
+                elif exact_division:
+                    return None
+                else:
+                    term = Fraction(term, atom)
+                    if term.denominator == 1:
+                        term = term.numerator
+            else:
+                total += sign * term
+                term, sign = atom, (1 if operator == '+' else -1)
+        return total, term, sign
+    def __is_group(self, part, prev_operator, operator, i):
+        """Whether a nested part placed after operator is wrapped in parentheses."""
+        return bool(part[2]) and self.needs_parentheses(prev_operator, operator, i < 2)
+    def __placed_part(self, part, prev_operator, operator, i):
+        """The (atoms, operators) a part contributes when placed after operator:
+        a single atom if it is parenthesized, its own flat sequence otherwise."""
+        if self.__is_group(part, prev_operator, operator, i):
+            return [part[3]], []
+        return part[1], part[2]
+    def __construct_expression(self, blocks, exact_division, nesting_level=0):
+        """Build an expression with the same shape rules as generate_expression,
+        tracking values as it goes so that '/' is only placed where the divisor
+        it ends up applying to is nonzero (and divides exactly, if requested).
+
+        Returns (text, atoms, operators, value): the flat sequence of atoms
+        (operands and parenthesized groups, by value) and the operators
+        between them as they appear in the text, and the expression's value.
+        """
+        arities, choices, coins, operands = blocks
+        if nesting_level >= self.max_nesting:
+            operand = operands.next()
+            return str(operand), [operand], [], operand
+        parts = []
+        atoms, operators = [], []
+        state = (0, 0, 1)
+        prev_operator = None
+        for i in range(arities.next()):
+            for __ in range(100):
+                if nesting_level + 1 < self.max_nesting and coins.next():
+                    part = self.__construct_expression(blocks, exact_division, nesting_level + 1)
+                else:
+                    operand = operands.next()
+                    part = (str(operand), [operand], [], operand)
+                if i == 0:
+                    current_operator = None
+                    folded = self.__fold_part(state, '+', part[1], part[2], exact_division)
+                    break
+                # Only '/' can make the expression invalid: the part's own
+                # divisions were checked when it was built, and + - * keep
+                # their divisors (and exactness, on integer terms) unchanged
+                division = None
+                if '/' in self.operators:
+                    division = self.__fold_part(state, '/', *self.__placed_part(part, prev_operator, '/', i),
+                                                exact_division)
+                valid = [operator for operator in self.operators if operator != '/' or division is not None]
+                if valid:
+                    # Pick uniformly among the operators that keep the expression valid
+                    current_operator = valid[int(choices.next() * len(valid))]
+                    folded = division if current_operator == '/' else \
+                             self.__fold_part(state, current_operator,
+                                              *self.__placed_part(part, prev_operator, current_operator, i),
+                                              exact_division)
+                    break
+            else:
+                raise ValueError("No operator can be placed without an invalid division; "
+                                 "check the operand range and operators")
+            if i > 0:
+                parts.append(f" {current_operator} ")
+                operators.append(current_operator)
+            if i > 0 and self.__is_group(part, prev_operator, current_operator, i):
+                parts.append(f"({part[0]})")
+                atoms.append(part[3])
+            else:
+                parts.append(part[0])
+                atoms.extend(part[1])
+                operators.extend(part[2])
+            state = folded
+            prev_operator = current_operator
+        total, term, sign = state
+        return "".join(parts), atoms, operators, total + sign * term
+    def generate_constructive(self, n, rng=None, exact_division=False):
+        """Generate n (expression, value) pairs that are valid by construction.
+
+        Instead of generating a candidate and rejecting it when it divides by
+        zero, each subtree's value is tracked while it is built and '/' is
+        only chosen where the divisor it applies to is nonzero. With
+        exact_division, '/' is also only placed where it divides exactly, so
+        every step of the evaluation stays an integer. Values are exact
+        Fractions. Expressions may still repeat.
+        """
+        rng = np.random.default_rng(rng)
+        block_size = max(1024, n * 3 ** min(self.max_nesting, 3))
+        blocks = (RandomBlock(lambda size: rng.integers(2, 4, size), block_size),
+                  RandomBlock(lambda size: rng.random(size), block_size),
+                  RandomBlock(lambda size: rng.integers(0, 2, size), block_size),
+                  RandomBlock(lambda size: rng.integers(self.min_value, self.max_value, size), block_size))
+        pairs = []
+        for __ in range(n):
+            text, __, __, value = self.__construct_expression(blocks, exact_division)
+            pairs.append((text, value))
+        return pairs
+    def __candidate_expressions(self, rng, batch_size, constructive=False, exact_division=False):
+        """Endless stream of (candidate expression, value) pairs. The value is
+        only known up front (and the candidate valid) in constructive mode;
+        otherwise it is None and the candidate still has to be evaluated."""
+        if constructive:
+            if rng is None:
+                # Seed from the global random state so np.random.seed still
+                # makes the stream reproducible, as in the default mode
+                rng = np.random.randint(2 ** 63, dtype=np.int64)
+            rng = np.random.default_rng(rng)
+            while True:
+                yield from self.generate_constructive(batch_size, rng, exact_division)
+        if rng is None:
+            while True:
+                yield self.generate_expression(), None
+        rng = np.random.default_rng(rng)
+        while True:
+            for expression in self.generate_batch(batch_size, rng):
+                yield expression, None
+    def generate_iter(self, num_samples=None, dedup="set", error_rate=1e-6, rng=None, batch_size=1024,
+                      constructive=False, exact_division=False):
+        """Lazily yield unique, evaluable arithmetic expressions as they are generated.
+
+        dedup selects how previously yielded expressions are remembered: "set"
+        keeps every expression in a hash set (exact), while "bloom" uses a
+        bounded-memory Bloom filter sized for num_samples, which may very rarely
+        reject a new expression as a false positive but never yields a duplicate.
+
+        By default candidates come from generate_expression and NumPy's global
+        random state. Passing rng (a np.random.Generator or a seed) draws them
+        through generate_batch in blocks of batch_size instead. constructive
+        draws them through generate_constructive (seeded from the global random
+        state when rng is None), so no candidate is rejected
+        for dividing by zero and only duplicates are skipped; exact_division
+        additionally restricts '/' to exact divisions.
+
+        If self.stats is set, rejected candidates are counted by reason
+        ("duplicate" or "undefined") and generation/validation are timed.
+        """
+        if num_samples is None:
+            num_samples = self.num_samples
+        if dedup == "set":
+            seen = set()
+        elif dedup == "bloom":
+            seen = BloomFilter(max(num_samples, 1), error_rate)
+        else:
+            raise ValueError(f"Unknown dedup mode: {dedup!r}")
         i = 0
-        while i < self.num_samples:
-            next_expression = self.generate_expression()
-            # Only insert the expression in the dataset if there are no divide by zero issues
-            try:
-                expression = sp.sympify(next_expression)
-                subexpr_result = str(float(expression.evalf()))
-                # Since a result was obtained, its safe to add if it does already exist
-                if next_expression not in dataset.values() and subexpr_result != "nan":
-                    dataset[i] = next_expression
-                    i += 1
-            # if the expression string could not be evaluated, it has errors;
-            # don't add to dataset
-            except:
+        candidates = self.__candidate_expressions(rng, batch_size, constructive, exact_division)
+        stats = self.stats
+        while i < num_samples:
+            if stats is not None:
+                start = time.perf_counter()
+            next_expression, value = next(candidates)
+            if stats is not None:
+                generated = time.perf_counter()
+                stats.add_time("generate", generated - start)
+            if next_expression in seen:
+                if stats is not None:
+                    stats.reject("duplicate")
                 continue
-        return dataset
+            if not constructive:
+                # Only yield the expression if there are no divide by zero issues
+                value = self.rational_eval.evaluate(next_expression)
+                if stats is not None:
+                    stats.add_time("validate", time.perf_counter() - generated)
+                if value is None:
+                    if stats is not None:
+                        stats.reject("undefined")
+                    continue
+            if self.cross_check and not self.rational_eval.agrees_with_sympy(next_expression, value):
+                raise RuntimeError(f"Rational evaluator disagrees with sympy on {next_expression!r}")
+            seen.add(next_expression)
+            if stats is not None:
+                stats.accept(next_expression)
+            i += 1
+            yield next_expression
+    def generate_dataset(self):
+        """Generates a dictionary containing indexed arithmetic expressions."""
+        return dict(enumerate(self.generate_iter()))
     
 
 def main():
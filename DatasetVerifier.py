@@ -0,0 +1,220 @@
+###############################################################################
+## Description: Verifies a stored processed dataset in bulk: every step of   ##
+##              every sample must have the same value as the original        ##
+##              expression. Step values are computed in floating point and   ##
+##              compared for a whole chunk at once with NumPy, and only the  ##
+##              steps whose float comparison is too close to the tolerance   ##
+##              to be trusted are re-checked exactly with rationals. Chunks  ##
+##              are spread over worker processes and every failing sample   ##
+##              is reported with the index of its first bad step.            ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+import json
+import math
+import multiprocessing
+from fractions import Fraction
+from itertools import islice
+import numpy as np
+from DatasetWriter import iter_dataset
+from ExpressionTokenizer import tokenize
+from RationalEvaluator import RationalEvaluator
+
+# A float comparison is re-checked exactly when the difference lies within
+# this factor of the tolerance (either side)
+BORDERLINE_FACTOR = 4.0
+
+def evaluate_float(expression_str):
+    """Float value of an expression, with the operator precedence of
+    RationalEvaluator, or nan if it cannot be computed in floating point
+    (characters outside the grammar, division by zero, overflow, ...)."""
+    tokens = tokenize(expression_str)
+    if tokens is None:
+        return math.nan
+    tokens = [token for token in tokens if token and token != " "]
+    pos = 0
+    def parse_sum():
+        nonlocal pos
+        value = parse_product()
+        while pos < len(tokens) and tokens[pos] in ("+", "-"):
+            operator = tokens[pos]
+            pos += 1
+            rhs = parse_product()
+            value = value + rhs if operator == "+" else value - rhs
+        return value
+    def parse_product():
+        nonlocal pos
+        value = parse_unary()
+        while pos < len(tokens) and tokens[pos] in ("*", "/"):
+            operator = tokens[pos]
+            pos += 1
+            rhs = parse_unary()
+            value = value * rhs if operator == "*" else value / rhs
+        return value
+    def parse_unary():
+        nonlocal pos
+        if pos < len(tokens) and tokens[pos] in ("+", "-"):
+            operator = tokens[pos]
+            pos += 1
+            value = parse_unary()
+            return -value if operator == "-" else value
+        value = parse_atom()
+        if pos < len(tokens) and tokens[pos] == "^":
+            pos += 1
+            value = value ** parse_unary()
+        return value
+    def parse_atom():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        if token == "(":
+            value = parse_sum()
+            if tokens[pos] != ")":
+                raise ValueError("Unbalanced parentheses in expression")
+            pos += 1
+            return value
+        return float(token)
+    try:
+        value = parse_sum()
+    except (ArithmeticError, IndexError, ValueError, TypeError):
+        return math.nan
+    if pos != len(tokens) or isinstance(value, complex):
+        return math.nan
+    return value
+
+class DatasetVerifier:
+    def __init__(self, rel_tol=1e-09, abs_tol=1e-06):
+        # A step is correct when |step value - true value| <= abs_tol + rel_tol * |true value|,
+        # the tolerance used by the check in ExpressionEvaluator.main
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        # The same tolerances as exact rationals, for the exact re-checks
+        self.__exact_rel_tol = Fraction(rel_tol)
+        self.__exact_abs_tol = Fraction(abs_tol)
+        self.rational_eval = RationalEvaluator()
+    def __exact_value(self, expression_str):
+        try:
+            return self.rational_eval.evaluate(expression_str)
+        except ValueError:
+            return None
+    def __exactly_close(self, step_value, true_value):
+        if step_value is None:
+            return False
+        tolerance = self.__exact_abs_tol + self.__exact_rel_tol * abs(true_value)
+        return abs(step_value - true_value) <= tolerance
+    def verify_chunk(self, samples):
+        """Check a list of (expression, list of step strings) pairs. Returns a
+        failure record for every sample with a bad step or an undefined value."""
+        failures = []
+        true_values = []
+        step_values = []
+        step_counts = []
+        checked = []
+        for expression, steps in samples:
+            true_value = self.__exact_value(expression)
+            if true_value is None:
+                failures.append({"expression": expression, "first_bad_step": None,
+                                 "step": None, "error": "expression has no finite value"})
+                continue
+            checked.append((expression, steps, true_value))
+            true_values.append(float(true_value))
+            step_values.extend(evaluate_float(step) for step in steps)
+            step_counts.append(len(steps))
+        if not checked:
+            return failures
+        step_counts = np.array(step_counts)
+        step_values = np.array(step_values, dtype=float)
+        expected = np.repeat(np.array(true_values, dtype=float), step_counts)
+        with np.errstate(invalid="ignore", over="ignore"):
+            tolerance = self.abs_tol + self.rel_tol * np.abs(expected)
+            difference = np.abs(step_values - expected)
+            is_close = np.isclose(step_values, expected, rtol=self.rel_tol, atol=self.abs_tol)
+            # Non-finite values and differences near the tolerance are decided exactly
+            is_borderline = ~np.isfinite(difference) | ~np.isfinite(expected) | \
+                            ((difference > tolerance / BORDERLINE_FACTOR) & (difference < tolerance * BORDERLINE_FACTOR))
+        needs_review = ~is_close | is_borderline
+        sample_starts = np.concatenate(([0], np.cumsum(step_counts)[:-1]))
+        for sample_index in np.unique(np.repeat(np.arange(len(checked)), step_counts)[needs_review]):
+            expression, steps, true_value = checked[sample_index]
+            start = sample_starts[sample_index]
+            for step_index, step in enumerate(steps):
+                position = start + step_index
+                if not needs_review[position]:
+                    continue
+                if is_borderline[position]:
+                    if self.__exactly_close(self.__exact_value(step), true_value):
+                        continue
+                failures.append({"expression": expression, "first_bad_step": step_index, "step": step,
+                                 "expected": float(true_value), "got": float(step_values[position])})
+                break
+        return failures
+    def verify(self, samples, num_workers=1, chunk_size=1024, progress_callback=None):
+        """Verify (raw sample, processed sample) pairs, e.g. iter_dataset(path),
+        streaming them in chunks of chunk_size over num_workers processes.
+        Returns (number of samples checked, failures in dataset order)."""
+        chunks = iter_chunks(samples, chunk_size)
+        num_checked = 0
+        failures = []
+        if num_workers <= 1:
+            results = ((len(chunk), self.verify_chunk(chunk)) for chunk in chunks)
+            for num_samples, chunk_failures in results:
+                num_checked += num_samples
+                failures.extend(chunk_failures)
+                if progress_callback is not None:
+                    progress_callback(num_checked, len(failures))
+            return num_checked, failures
+        with multiprocessing.Pool(num_workers, initializer=init_worker,
+                                  initargs=(self.rel_tol, self.abs_tol)) as pool:
+            # imap returns chunk results in submission order
+            for num_samples, chunk_failures in pool.imap(verify_chunk, chunks):
+                num_checked += num_samples
+                failures.extend(chunk_failures)
+                if progress_callback is not None:
+                    progress_callback(num_checked, len(failures))
+        return num_checked, failures
+
+def iter_chunks(samples, chunk_size):
+    """Lists of (expression, list of step strings), chunk_size at a time."""
+    pairs = ((raw_sample, list(processed_sample["eval_steps"].values()))
+             for raw_sample, processed_sample in samples)
+    while True:
+        chunk = list(islice(pairs, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# Per-process verifier used by the worker processes of DatasetVerifier.verify
+worker_verifier = None
+
+def init_worker(rel_tol, abs_tol):
+    global worker_verifier
+    worker_verifier = DatasetVerifier(rel_tol, abs_tol)
+
+def verify_chunk(chunk):
+    return len(chunk), worker_verifier.verify_chunk(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify every step of a stored processed dataset.")
+    parser.add_argument("dataset", help="JSONL file or Parquet directory written by a DatasetWriter")
+    parser.add_argument("--num-workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--rel-tol", type=float, default=1e-09)
+    parser.add_argument("--abs-tol", type=float, default=1e-06)
+    parser.add_argument("--output", help="where to write the failures as JSON")
+    args = parser.parse_args()
+
+    verifier = DatasetVerifier(args.rel_tol, args.abs_tol)
+    num_checked, failures = verifier.verify(iter_dataset(args.dataset), args.num_workers, args.chunk_size)
+    for failure in failures:
+        print(f"step {failure['first_bad_step']} of {failure['expression']!r}: {failure['step']!r}",
+              f"(expected {failure['expected']}, got {failure['got']})" if "expected" in failure
+              else f"({failure['error']})")
+    print(f"checked {num_checked} samples, {len(failures)} failing")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"num_checked": num_checked, "failures": failures}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
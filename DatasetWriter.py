@@ -0,0 +1,182 @@
+###############################################################################
+## Description: Defines sinks that stream processed samples to disk as they  ##
+##              are produced by ExpressionEvaluator, flushing in batches so  ##
+##              an interrupted run can be resumed by skipping the samples    ##
+##              already written. Supports JSONL and Parquet (via pyarrow).   ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import json
+import os
+from CompactSteps import CompactSteps
+
+class DatasetWriter:
+    """Buffers processed samples and writes them out every batch_size samples.
+
+    Subclasses implement read_completed (the expressions already on disk) and
+    write_batch (persist a list of records). Use as a context manager so the
+    final partial batch is flushed.
+    """
+    def __init__(self, path, batch_size=1000, resume=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.__buffer = []
+        self.num_written = 0
+        # Expressions already written by a previous (interrupted) run
+        self.completed = self.read_completed() if resume else set()
+    def __contains__(self, raw_sample):
+        return raw_sample in self.completed
+    def write(self, raw_sample, processed_sample):
+        """Queue one processed sample, flushing once a full batch is buffered."""
+        self.__buffer.append(to_record(raw_sample, processed_sample))
+        self.completed.add(raw_sample)
+        if len(self.__buffer) >= self.batch_size:
+            self.flush()
+    def flush(self):
+        if self.__buffer:
+            self.write_batch(self.__buffer)
+            self.num_written += len(self.__buffer)
+            self.__buffer = []
+    def close(self):
+        self.flush()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Flush what was completed even on error so a restart can skip it
+        self.close()
+    def read_completed(self):
+        raise NotImplementedError
+    def write_batch(self, records):
+        raise NotImplementedError
+
+class JsonlDatasetWriter(DatasetWriter):
+    """Appends one JSON object per line to a single file."""
+    def __init__(self, path, batch_size=1000, resume=True):
+        super().__init__(path, batch_size, resume)
+        self.__file = open(path, "a" if resume else "w", encoding="utf-8")
+    def read_completed(self):
+        completed = set()
+        if not os.path.exists(self.path):
+            return completed
+        valid_end = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                # A line cut short by a crash is dropped and rewritten later
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    completed.add(json.loads(line)["expression"])
+                except ValueError:
+                    break
+                valid_end += len(line)
+        if valid_end != os.path.getsize(self.path):
+            os.truncate(self.path, valid_end)
+        return completed
+    def write_batch(self, records):
+        self.__file.write("".join(json.dumps(record) + "\n" for record in records))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+    def close(self):
+        super().close()
+        self.__file.close()
+
+class ParquetDatasetWriter(DatasetWriter):
+    """Writes each batch as a separate Parquet part file inside a directory,
+    with eval_steps stored as a list column and the counts as map columns."""
+    def __init__(self, path, batch_size=10000, resume=True):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            raise ImportError("ParquetDatasetWriter requires pyarrow (pip install pyarrow)") from error
+        self.__pa = pyarrow
+        self.__pq = pyarrow.parquet
+        counts_type = pyarrow.map_(pyarrow.string(), pyarrow.int64())
+        self.__schema = pyarrow.schema([("expression", pyarrow.string()),
+                                        ("eval_steps", pyarrow.list_(pyarrow.string())),
+                                        ("operator_counts", counts_type),
+                                        ("operand_counts", counts_type)])
+        # Layout used when eval_steps are CompactSteps
+        self.__compact_schema = pyarrow.schema([("expression", pyarrow.string()),
+                                                ("step_starts", pyarrow.list_(pyarrow.uint32())),
+                                                ("step_ends", pyarrow.list_(pyarrow.uint32())),
+                                                ("step_replacements", pyarrow.list_(pyarrow.string())),
+                                                ("operator_counts", counts_type),
+                                                ("operand_counts", counts_type)])
+        os.makedirs(path, exist_ok=True)
+        if not resume:
+            for file_name in part_files(path):
+                os.remove(os.path.join(path, file_name))
+        super().__init__(path, batch_size, resume)
+        self.__next_part = len(part_files(path))
+    def read_completed(self):
+        completed = set()
+        for file_name in part_files(self.path):
+            table = self.__pq.read_table(os.path.join(self.path, file_name), columns=["expression"])
+            completed.update(table.column("expression").to_pylist())
+        return completed
+    def write_batch(self, records):
+        schema = self.__compact_schema if "step_starts" in records[0] else self.__schema
+        columns = {name: [record[name] for record in records] for name in schema.names}
+        columns["operator_counts"] = [list(counts.items()) for counts in columns["operator_counts"]]
+        columns["operand_counts"] = [list(counts.items()) for counts in columns["operand_counts"]]
+        table = self.__pa.Table.from_pydict(columns, schema=schema)
+        file_name = f"part-{self.__next_part:05d}.parquet"
+        # Write then rename so a crash never leaves a truncated part behind
+        tmp_path = os.path.join(self.path, file_name + ".tmp")
+        self.__pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, file_name))
+        self.__next_part += 1
+
+def part_files(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("part-") and name.endswith(".parquet"))
+
+def to_record(raw_sample, processed_sample):
+    """Flatten a processed sample into a record with eval_steps as a list, or
+    as step_starts/step_ends/step_replacements edit columns for CompactSteps."""
+    eval_steps = processed_sample["eval_steps"]
+    record = {"expression": raw_sample}
+    if isinstance(eval_steps, CompactSteps):
+        record["step_starts"], record["step_ends"], record["step_replacements"] = eval_steps.edits()
+    else:
+        record["eval_steps"] = list(eval_steps.values())
+    record["operator_counts"] = processed_sample["operator_counts"]
+    record["operand_counts"] = processed_sample["operand_counts"]
+    return record
+
+def from_record(record):
+    """Inverse of to_record: returns (raw sample, processed sample) in the
+    format produced by ExpressionEvaluator.process_dataset."""
+    if "step_starts" in record:
+        eval_steps = CompactSteps(record["expression"], record["step_starts"],
+                                  record["step_ends"], record["step_replacements"])
+    else:
+        eval_steps = dict(enumerate(record["eval_steps"]))
+    return record["expression"], {"eval_steps": eval_steps,
+                                  "operator_counts": dict(record["operator_counts"]),
+                                  "operand_counts": dict(record["operand_counts"])}
+
+def iter_jsonl_dataset_records(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+def iter_parquet_dataset_records(path):
+    import pyarrow.parquet as pq
+    for file_name in part_files(path):
+        yield from pq.read_table(os.path.join(path, file_name)).to_pylist()
+
+def iter_dataset(path):
+    """Stream (raw sample, processed sample) pairs from a dataset written by
+    either writer; a directory is read as Parquet parts, a file as JSONL."""
+    records = iter_parquet_dataset_records(path) if os.path.isdir(path) else iter_jsonl_dataset_records(path)
+    for record in records:
+        yield from_record(record)
+
+def open_writer(path, batch_size=None, resume=True):
+    """Open a writer for path, choosing Parquet for a path ending in .parquet
+    (used as a directory of parts) and JSONL otherwise."""
+    writer_class = ParquetDatasetWriter if path.endswith(".parquet") else JsonlDatasetWriter
+    if batch_size is None:
+        return writer_class(path, resume=resume)
+    return writer_class(path, batch_size, resume)
@@ -0,0 +1,191 @@
+###############################################################################
+## Description: Per-sample difficulty metadata and a bucket index for        ##
+##              curriculum sampling. Compact integer columns (nesting depth, ##
+##              steps, operator counts and mix, operand range, ...) are      ##
+##              computed as samples are processed, and samples are grouped   ##
+##              into buckets by a few of those columns, each bucket holding  ##
+##              its sorted sample IDs. Drawing a batch from the buckets that ##
+##              match a filter then costs O(batch) instead of a scan of the  ##
+##              whole dataset. The index is saved next to the dataset.       ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+from array import array
+import numpy as np
+from DatasetWriter import iter_dataset
+
+# Bit of each operator in the operator_mix column
+OPERATOR_BITS = {"+": 1, "-": 2, "*": 4, "/": 8, "^": 16}
+COLUMNS = ("length", "nesting_depth", "num_steps", "num_operators", "num_add", "num_sub", "num_mul",
+           "num_div", "num_pow", "num_parentheses", "operator_mix", "max_operand", "operand_digits")
+# Columns whose combined values define the buckets; they have few distinct values
+DEFAULT_BUCKET_COLUMNS = ("nesting_depth", "num_steps", "operator_mix", "operand_digits")
+COLUMN_DTYPE = np.int32
+ID_DTYPE = np.int64
+
+def index_path(dataset_path):
+    """Where the index of a dataset (JSONL file or Parquet directory) is saved."""
+    return dataset_path.rstrip("/") + ".difficulty.npz"
+
+def sample_metadata(raw_sample, processed_sample):
+    """Difficulty metadata of one processed sample, as a tuple in COLUMNS
+    order. "-" counts every minus sign, as operator_counts does."""
+    operator_counts = processed_sample["operator_counts"]
+    depth = max_depth = 0
+    for char in raw_sample:
+        if char == "(":
+            depth += 1
+            max_depth = max(max_depth, depth)
+        elif char == ")":
+            depth -= 1
+    operator_mix = 0
+    for operator, bit in OPERATOR_BITS.items():
+        if operator_counts.get(operator):
+            operator_mix |= bit
+    max_operand = max(map(int, processed_sample["operand_counts"]), default=0)
+    num_parentheses = operator_counts.get("(", 0) + operator_counts.get(")", 0)
+    return (len(raw_sample), max_depth, len(processed_sample["eval_steps"]),
+            sum(operator_counts.values()) - num_parentheses,
+            operator_counts.get("+", 0), operator_counts.get("-", 0), operator_counts.get("*", 0),
+            operator_counts.get("/", 0), operator_counts.get("^", 0), num_parentheses,
+            operator_mix, max_operand, len(str(max_operand)))
+
+def columns_from_rows(rows):
+    """Split a flat array of sample_metadata rows into named columns."""
+    values = np.frombuffer(rows, dtype=np.intc).astype(COLUMN_DTYPE).reshape(-1, len(COLUMNS))
+    return {name: values[:, i].copy() for i, name in enumerate(COLUMNS)}
+
+class DifficultyIndex:
+    """Metadata columns of a dataset (sample i is the i-th sample stored) and
+    the bucket index over bucket_columns. Sample IDs are laid out bucket by
+    bucket in bucket_ids, sorted within each bucket, with bucket b occupying
+    bucket_ids[bucket_offsets[b]:bucket_offsets[b + 1]] and having the
+    bucket_columns values in row b of bucket_keys."""
+    def __init__(self, columns, bucket_columns=DEFAULT_BUCKET_COLUMNS, buckets=None):
+        unknown = set(bucket_columns) - set(columns)
+        if unknown:
+            raise ValueError(f"Unknown bucket columns: {', '.join(sorted(unknown))}")
+        self.columns = {name: np.asarray(values, dtype=COLUMN_DTYPE) for name, values in columns.items()}
+        self.bucket_columns = tuple(bucket_columns)
+        if buckets is not None:
+            # (bucket_keys, bucket_ids, bucket_offsets) of a saved index
+            self.bucket_keys, self.bucket_ids, self.bucket_offsets = buckets
+            return
+        num_samples = len(next(iter(self.columns.values()))) if self.columns else 0
+        keys = np.stack([self.columns[name] for name in self.bucket_columns], axis=1) \
+            if num_samples else np.zeros((0, len(self.bucket_columns)), dtype=COLUMN_DTYPE)
+        self.bucket_keys, bucket_of_sample = np.unique(keys, axis=0, return_inverse=True)
+        bucket_of_sample = bucket_of_sample.reshape(-1)
+        # A stable sort keeps the IDs of each bucket in increasing order
+        self.bucket_ids = np.argsort(bucket_of_sample, kind="stable").astype(ID_DTYPE)
+        self.bucket_offsets = np.zeros(len(self.bucket_keys) + 1, dtype=ID_DTYPE)
+        np.cumsum(np.bincount(bucket_of_sample, minlength=len(self.bucket_keys)), out=self.bucket_offsets[1:])
+    @classmethod
+    def from_samples(cls, samples, bucket_columns=DEFAULT_BUCKET_COLUMNS):
+        """Index (raw sample, processed sample) pairs, e.g. iter_dataset(path)
+        or process_dataset().items(), streaming them."""
+        rows = array("i")
+        for raw_sample, processed_sample in samples:
+            rows.extend(sample_metadata(raw_sample, processed_sample))
+        return cls(columns_from_rows(rows), bucket_columns)
+    def __len__(self):
+        return len(self.bucket_ids)
+    def save(self, path):
+        np.savez(path, bucket_columns=np.array(self.bucket_columns), bucket_keys=self.bucket_keys,
+                 bucket_ids=self.bucket_ids, bucket_offsets=self.bucket_offsets,
+                 **{f"column_{name}": values for name, values in self.columns.items()})
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {name[len("column_"):]: data[name] for name in data.files if name.startswith("column_")}
+            return cls(columns, tuple(data["bucket_columns"].tolist()),
+                       (data["bucket_keys"], data["bucket_ids"], data["bucket_offsets"]))
+    def bucket(self, index):
+        """Sorted sample IDs of bucket index (a view)."""
+        return self.bucket_ids[self.bucket_offsets[index]:self.bucket_offsets[index + 1]]
+    def matching_buckets(self, **conditions):
+        """Indices of the buckets whose bucket_columns satisfy every condition:
+        a value, a (low, high) inclusive range, or a list/set of values."""
+        matches = np.ones(len(self.bucket_keys), dtype=bool)
+        for name, condition in conditions.items():
+            if name not in self.bucket_columns:
+                raise ValueError(f"{name!r} is not a bucket column ({', '.join(self.bucket_columns)})")
+            values = self.bucket_keys[:, self.bucket_columns.index(name)]
+            if isinstance(condition, tuple):
+                low, high = condition
+                matches &= (values >= low) & (values <= high)
+            elif isinstance(condition, (list, set, frozenset)):
+                matches &= np.isin(values, list(condition))
+            else:
+                matches &= values == condition
+        return np.flatnonzero(matches)
+    def sampler(self, rng=None, **conditions):
+        """Return a function drawing batch_size sample IDs uniformly (with
+        replacement) from the samples matching the conditions. The matching
+        buckets are found once, so every draw costs O(batch_size)."""
+        rng = np.random.default_rng(rng)
+        buckets = self.matching_buckets(**conditions)
+        sizes = self.bucket_offsets[buckets + 1] - self.bucket_offsets[buckets]
+        buckets, sizes = buckets[sizes > 0], sizes[sizes > 0]
+        if not len(buckets):
+            raise ValueError(f"No samples match {conditions}")
+        if len(buckets) == 1:
+            ids = self.bucket(buckets[0])
+            return lambda batch_size: ids[rng.integers(0, len(ids), batch_size)]
+        # Draw positions among all matching samples and map each to its bucket
+        cumulative_sizes = np.cumsum(sizes)
+        starts = self.bucket_offsets[buckets]
+        def sample(batch_size):
+            positions = rng.integers(0, cumulative_sizes[-1], batch_size)
+            bucket_indices = np.searchsorted(cumulative_sizes, positions, side="right")
+            first_positions = cumulative_sizes[bucket_indices] - sizes[bucket_indices]
+            return self.bucket_ids[starts[bucket_indices] + positions - first_positions]
+        return sample
+    def sample(self, batch_size, rng=None, **conditions):
+        """Draw one batch of sample IDs matching the conditions; use sampler
+        to draw many batches with the same conditions."""
+        return self.sampler(rng, **conditions)(batch_size)
+    def num_matching(self, **conditions):
+        buckets = self.matching_buckets(**conditions)
+        return int(np.sum(self.bucket_offsets[buckets + 1] - self.bucket_offsets[buckets]))
+
+class IndexingSink:
+    """Wraps a DatasetWriter sink for process_dataset, recording the metadata
+    of every sample as it is written and saving the index next to the dataset
+    when closed. Samples already held by a resumed writer are indexed from
+    disk first, so IDs always follow the order of the stored samples."""
+    def __init__(self, writer, bucket_columns=DEFAULT_BUCKET_COLUMNS):
+        self.writer = writer
+        self.bucket_columns = bucket_columns
+        self.__rows = array("i")
+        if writer.completed:
+            for raw_sample, processed_sample in iter_dataset(writer.path):
+                self.__rows.extend(sample_metadata(raw_sample, processed_sample))
+    def __contains__(self, raw_sample):
+        return raw_sample in self.writer
+    def write(self, raw_sample, processed_sample):
+        self.writer.write(raw_sample, processed_sample)
+        self.__rows.extend(sample_metadata(raw_sample, processed_sample))
+    def close(self):
+        self.writer.close()
+        self.index = DifficultyIndex(columns_from_rows(self.__rows), self.bucket_columns)
+        self.index.save(index_path(self.writer.path))
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the difficulty index of a stored dataset.")
+    parser.add_argument("dataset", help="JSONL file or Parquet directory written by a DatasetWriter")
+    args = parser.parse_args()
+
+    index = DifficultyIndex.from_samples(iter_dataset(args.dataset))
+    index.save(index_path(args.dataset))
+    print(f"indexed {len(index)} samples into {len(index.bucket_keys)} buckets over "
+          f"{', '.join(index.bucket_columns)}: {index_path(args.dataset)}")
+
+if __name__ == "__main__":
+    main()
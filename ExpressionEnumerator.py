@@ -0,0 +1,307 @@
+###############################################################################
+## Description: Counts the distinct expressions ExpressionGenerator's        ##
+##              grammar can produce for a given operand range, operator set  ##
+##              and max_nesting (respecting needs_parentheses), and unranks  ##
+##              any index in [0, count) into its expression. This allows     ##
+##              duplicate-free sampling without a dedup set, exhaustive      ##
+##              datasets for small configurations, and sharding by index.    ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import random
+import sys
+from DatasetGenerator import ExpressionGenerator
+
+class ExpressionEnumerator:
+    """Enumerates the expression strings generate_expression can produce.
+
+    An expression is read as a word over item symbols: "O" for an operand,
+    an operator, or ("P", m) for a parenthesized group. Nested parts that are
+    not parenthesized are spliced into their parent's text, so different
+    choices of parts and nesting can give the same string; counting words of
+    a deterministic automaton for the grammar counts each string once. A
+    group is labelled with the deepest nesting level m whose grammar can
+    produce its content, which gives every string a single word. Counts and
+    the automaton states are computed once; unranking then walks one path.
+    """
+    def __init__(self, generator=None, max_states=100000):
+        self.generator = generator if generator is not None else ExpressionGenerator()
+        # The automaton grows steeply with max_nesting: under a second for 3
+        # levels, but ~70k states and minutes for 4. Spaces that large are
+        # sampled randomly without repeats in practice, so past max_states
+        # enumeration is refused instead
+        self.max_states = max_states
+        self.max_nesting = self.generator.max_nesting
+        self.min_value = self.generator.min_value
+        self.num_operands = max(self.generator.max_value - self.generator.min_value, 0)
+        # Repeated operators in the generator's list only change its weights
+        self.operators = list(dict.fromkeys(self.generator.operators))
+        self.symbols = ["O"] + self.operators + [("P", m) for m in range(1, self.max_nesting)]
+        # Deterministic automaton: state id -> configurations, and transitions
+        self.__state_ids = {}
+        self.__states = []
+        self.__transitions = []
+        self.__accepting = []
+        # wraps for the operator after the first part (prev_operator is None
+        # there), and for operators after which nothing is parenthesized
+        self.__first_wraps = self.__wraps(None, True)
+        self.__no_wraps = (False,) * len(self.operators)
+        # Number of expressions whose deepest producing level is m, keyed by m
+        self.__group_counts = {}
+        self.__counts = {}
+        for m in range(self.max_nesting - 1, 0, -1):
+            self.__group_counts[m] = self.__count(self.__start_state(m), self.__start_state(m + 1))
+        self.total = self.__count(self.__start_state(0), None) if self.max_nesting > 0 else self.num_operands
+
+    # Configurations are tuples of frames from the outermost expression to
+    # the innermost one being built; () means finished. A frame is
+    # (level, parts left, wraps, grouped). grouped is None while the operator
+    # before the next part is still to be read, and wraps then tells, for each
+    # operator, whether a nested part after it gets parentheses. Once the
+    # operator is read, grouped says whether that part does and wraps holds
+    # what the following operator will need. Keeping only what decides the
+    # rest of the expression lets equivalent frames compare equal
+    def __wraps(self, prev_operator, is_right):
+        return tuple(self.generator.needs_parentheses(prev_operator, operator, is_right)
+                     for operator in self.operators)
+    def __closure(self, configurations):
+        """Follow every choice that reads no symbol (entering or leaving a
+        nested part), keeping the configurations that read one next."""
+        kernel = set()
+        stack = list(configurations)
+        seen = set()
+        while stack:
+            configuration = stack.pop()
+            if configuration in seen:
+                continue
+            seen.add(configuration)
+            if not configuration:
+                kernel.add(configuration)
+                continue
+            level, parts_left, wraps, grouped = configuration[-1]
+            if parts_left == 0:
+                # The parent frame was already advanced past this part
+                stack.append(configuration[:-1])
+                continue
+            kernel.add(configuration)
+            if grouped is False and level + 1 < self.max_nesting:
+                parent = configuration[:-1] + ((level, parts_left - 1, wraps, None),)
+                for sub_parts in (2, 3):
+                    stack.append(parent + ((level + 1, sub_parts, self.__first_wraps, False),))
+        return self.__state_id(self.__prune(kernel))
+    def __prune(self, kernel):
+        """Drop configurations whose continuations another one already covers.
+
+        Finished frames waiting to be left read nothing, and a frame can
+        continue in every way the same frame one level deeper can. So a
+        configuration is covered by one with the same unfinished frames at the
+        same or shallower levels.
+        """
+        by_frames = {}
+        for configuration in kernel:
+            frames = tuple(frame[1:] for frame in configuration if frame[1] or frame[3] is not None)
+            levels = tuple(frame[0] for frame in configuration if frame[1] or frame[3] is not None)
+            by_frames.setdefault(frames, []).append(levels)
+        pruned = set()
+        for frames, level_choices in by_frames.items():
+            for levels in level_choices:
+                if not any(other != levels and all(o <= l for o, l in zip(other, levels))
+                           for other in level_choices):
+                    pruned.add(tuple((level,) + frame for level, frame in zip(levels, frames)))
+        return frozenset(pruned)
+    def __state_id(self, kernel):
+        state = self.__state_ids.get(kernel)
+        if state is None:
+            if len(self.__states) >= self.max_states:
+                raise ValueError(f"Too many expression shapes to enumerate (more than {self.max_states} "
+                                 f"automaton states); lower max_nesting or raise max_states")
+            state = self.__state_ids[kernel] = len(self.__states)
+            self.__states.append(kernel)
+            self.__transitions.append(None)
+            self.__accepting.append(() in kernel)
+        return state
+    def __start_state(self, level):
+        if level >= self.max_nesting:
+            return None
+        return self.__closure([((level, num_parts, self.__first_wraps, False),) for num_parts in (2, 3)])
+    def __step(self, state):
+        """Transitions of a state as {symbol: state}, built on first use."""
+        if self.__transitions[state] is not None:
+            return self.__transitions[state]
+        targets = {}
+        for configuration in self.__states[state]:
+            if not configuration:
+                continue
+            level, parts_left, wraps, grouped = configuration[-1]
+            parent = configuration[:-1]
+            if grouped is None:
+                for operator, wrap in zip(self.operators, wraps):
+                    # Two parts left means this operator precedes the middle of
+                    # three parts, and is prev_operator for the last one
+                    next_wraps = self.__wraps(operator, False) if parts_left == 2 else self.__no_wraps
+                    is_grouped = wrap and level + 1 < self.max_nesting
+                    targets.setdefault(operator, []).append(parent + ((level, parts_left, next_wraps, is_grouped),))
+                continue
+            advanced = parent + ((level, parts_left - 1, wraps, None),)
+            targets.setdefault("O", []).append(advanced)
+            if grouped:
+                for m in range(level + 1, self.max_nesting):
+                    targets.setdefault(("P", m), []).append(advanced)
+        self.__transitions[state] = {symbol: self.__closure(configurations)
+                                     for symbol, configurations in targets.items()}
+        return self.__transitions[state]
+    def __weight(self, symbol):
+        if symbol == "O":
+            return self.num_operands
+        if isinstance(symbol, tuple):
+            return self.__group_counts[symbol[1]]
+        return 1
+    def __count(self, state, excluded):
+        """Number of expressions readable from state but not from excluded
+        (None excludes nothing), each symbol weighted by its fillings."""
+        key = (state, excluded)
+        if key in self.__counts:
+            return self.__counts[key]
+        total = 1 if self.__accepting[state] and not (excluded is not None and self.__accepting[excluded]) else 0
+        excluded_transitions = self.__step(excluded) if excluded is not None else {}
+        for symbol, target in self.__step(state).items():
+            weight = self.__weight(symbol)
+            if weight:
+                total += weight * self.__count(target, excluded_transitions.get(symbol))
+        self.__counts[key] = total
+        return total
+    def __unrank(self, state, excluded, index):
+        items = []
+        while True:
+            if self.__accepting[state] and not (excluded is not None and self.__accepting[excluded]):
+                if index == 0:
+                    return " ".join(items)
+                index -= 1
+            excluded_transitions = self.__step(excluded) if excluded is not None else {}
+            transitions = self.__step(state)
+            for symbol in self.symbols:
+                if symbol not in transitions:
+                    continue
+                target, target_excluded = transitions[symbol], excluded_transitions.get(symbol)
+                count = self.__count(target, target_excluded)
+                block = self.__weight(symbol) * count
+                if index < block:
+                    filling, index = divmod(index, count)
+                    items.append(self.__fill(symbol, filling))
+                    state, excluded = target, target_excluded
+                    break
+                index -= block
+            else:
+                raise IndexError("expression index out of range")
+    def __fill(self, symbol, filling):
+        if symbol == "O":
+            return str(self.min_value + filling)
+        if isinstance(symbol, tuple):
+            m = symbol[1]
+            return "(" + self.__unrank(self.__start_state(m), self.__start_state(m + 1), filling) + ")"
+        return symbol
+    def __split_items(self, expression_str):
+        """Split an expression into its top level operands, operators and groups."""
+        items = []
+        depth = 0
+        start = 0
+        for pos, char in enumerate(expression_str):
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == " " and depth == 0:
+                items.append(expression_str[start:pos])
+                start = pos + 1
+        items.append(expression_str[start:])
+        return items
+    def __symbol_of(self, item):
+        """The (symbol, filling) an item was unranked from, or None."""
+        if item in self.operators:
+            return item, 0
+        if item.startswith("(") and item.endswith(")"):
+            # Label the group with the deepest level that can produce it
+            for m in range(self.max_nesting - 1, 0, -1):
+                filling = self.__rank(self.__start_state(m), self.__start_state(m + 1), item[1:-1])
+                if filling is not None:
+                    return ("P", m), filling
+            return None
+        try:
+            filling = int(item) - self.min_value
+        except ValueError:
+            return None
+        if str(self.min_value + filling) != item or not 0 <= filling < self.num_operands:
+            return None
+        return "O", filling
+    def __rank(self, state, excluded, expression_str):
+        index = 0
+        for item in self.__split_items(expression_str):
+            if self.__accepting[state] and not (excluded is not None and self.__accepting[excluded]):
+                index += 1
+            symbol_and_filling = self.__symbol_of(item)
+            if symbol_and_filling is None:
+                return None
+            symbol, filling = symbol_and_filling
+            excluded_transitions = self.__step(excluded) if excluded is not None else {}
+            transitions = self.__step(state)
+            if symbol not in transitions:
+                return None
+            for preceding in self.symbols:
+                if preceding == symbol:
+                    break
+                if preceding in transitions:
+                    index += self.__weight(preceding) * \
+                             self.__count(transitions[preceding], excluded_transitions.get(preceding))
+            state, excluded = transitions[symbol], excluded_transitions.get(symbol)
+            index += filling * self.__count(state, excluded)
+        if not self.__accepting[state] or (excluded is not None and self.__accepting[excluded]):
+            return None
+        return index
+    def __len__(self):
+        # len() is limited to sys.maxsize; use .total for larger spaces
+        return self.total
+    def unrank(self, index):
+        """Return the expression with the given index in [0, total)."""
+        if not 0 <= index < self.total:
+            raise IndexError(f"expression index {index} out of range [0, {self.total})")
+        if self.max_nesting <= 0:
+            return str(self.min_value + index)
+        return self.__unrank(self.__start_state(0), None, index)
+    def rank(self, expression_str):
+        """Inverse of unrank: the index of an expression the generator can produce."""
+        if self.max_nesting <= 0:
+            symbol_and_filling = self.__symbol_of(expression_str)
+            index = symbol_and_filling[1] if symbol_and_filling and symbol_and_filling[0] == "O" else None
+        else:
+            index = self.__rank(self.__start_state(0), None, expression_str)
+        if index is None:
+            raise ValueError(f"Expression cannot be produced by the generator: {expression_str!r}")
+        return index
+    def iter_range(self, start=0, stop=None):
+        """Yield the expressions with indices in [start, stop), e.g. one shard."""
+        stop = self.total if stop is None else min(stop, self.total)
+        for index in range(start, stop):
+            yield self.unrank(index)
+    def sample(self, n, seed=None):
+        """n distinct expressions drawn uniformly without replacement."""
+        rng = random.Random(seed)
+        if self.total <= sys.maxsize:
+            return [self.unrank(index) for index in rng.sample(range(self.total), n)]
+        # random.sample cannot take a range this long; repeats are
+        # astronomically rare here but still skipped
+        indices = {}
+        while len(indices) < n:
+            indices.setdefault(rng.randrange(self.total), None)
+        return [self.unrank(index) for index in indices]
+
+
+def main():
+    generator = ExpressionGenerator(min_value=0, max_value=10, max_nesting=3)
+    enumerator = ExpressionEnumerator(generator)
+    print("Number of distinct expressions:", enumerator.total)
+    for index in (0, 1, enumerator.total // 2, enumerator.total - 1):
+        print(index, enumerator.unrank(index))
+    print(enumerator.sample(5, seed=0))
+
+if __name__ == "__main__":
+    main()
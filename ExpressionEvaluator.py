@@ -12,16 +12,25 @@
 ##                   of occurences of each operator                          ##
 ##                c) "operand counts": a string detailing the total number   ##
 ##                    of occurences of each operand                          ##
-## Last Modified: 11 March 2024                                               ##
+## Last Modified: 17 October 2026                                             ##
 ###############################################################################
 
-import sympy as sp
 import numpy as np
 from DatasetGenerator import ExpressionGenerator
 from PrecedenceEvaluator import PrecedenceEvaluator
+from ExpressionTree import ExpressionTree
+from CompactSteps import CompactSteps
+from ExpressionTokenizer import tokenize, count_symbols, count_operators, render, \
+                                expand_sci_notation, SCI_NOTATION_REGEX
+from RationalEvaluator import RationalEvaluator
+from PipelineStats import PipelineStats
 import re # Needed for extracting operands and operators from regular 
           # expressions
+import decimal
+import functools
 import math
+import multiprocessing
+import time
 
 
 """
@@ -31,26 +40,68 @@ import math
 
 def convert_sci_notation_terms(expression):
 
-    # Regular expression to find numbers in scientific notation
-    sci_notation_regex = r'\b\d+\.?\d*[eE][+-]?\d+\b'
-
     def replace_sci_notation(match):
         # Convert the scientific notation number to decimal
         # and format it to remove trailing zeros
-        number = float(match.group())
-        return '{:f}'.format(number).rstrip('0').rstrip('.')
+        return expand_sci_notation(match.group())
+
+    # Replace all occurrences of scientific notation in the expression
+    return SCI_NOTATION_REGEX.sub(replace_sci_notation, expression)
+
+
+# Per-process evaluator used by the worker processes of process_dataset
+worker_evaluator = None
+
+def init_worker(evaluator_kwargs):
+    global worker_evaluator
+    worker_evaluator = ExpressionEvaluator({}, **evaluator_kwargs)
 
-    # Use re.sub() to replace all occurrences of scientific notation in the expression
-    return re.sub(sci_notation_regex, replace_sci_notation, expression)
+def process_chunk(raw_samples):
+    results = [worker_evaluator.process_sample_safely(raw_sample) for raw_sample in raw_samples]
+    # Hand the statistics of this chunk back to the parent and start afresh
+    chunk_stats = worker_evaluator.stats
+    if chunk_stats is not None:
+        worker_evaluator.stats = PipelineStats()
+    return results, chunk_stats
 
 
 class ExpressionEvaluator():
-    def __init__(self, raw_dataset, whitespace_amount):
+    def __init__(self, raw_dataset, whitespace_amount, cross_check=False, engine="string",
+                 cache_size=65536, compact_steps=False, stats=None, numeric_mode="float",
+                 decimal_places=6, rounding=decimal.ROUND_HALF_EVEN):
         self.__raw_dataset = raw_dataset
         self.__processed_dataset = {}
+        # Raw samples that could not be processed, mapped to the error raised
+        self.failed_samples = {}
         # Number of spaces to use between each operator and operand
         self.whitespace_amount = whitespace_amount
         self.precedence_eval = PrecedenceEvaluator()
+        # Step results are formatted as str(float(...)) ("float", the default),
+        # exactly ("fraction") or rounded to decimal_places with the given
+        # decimal rounding mode ("decimal"); see RationalEvaluator
+        self.numeric_mode = numeric_mode
+        self.decimal_places = decimal_places
+        self.rounding = rounding
+        self.rational_eval = RationalEvaluator(numeric_mode, decimal_places, rounding)
+        # When set, every step result is also verified with sympy (slow)
+        self.cross_check = cross_check
+        # "string" re-scans the expression string at every step, while "tree"
+        # parses it once with ExpressionTree and reduces it in place
+        if engine not in ("string", "tree"):
+            raise ValueError(f"Unknown evaluation engine: {engine!r}")
+        self.engine = engine
+        # Bounded LRU cache mapping atomic subexpressions (e.g. "8*7") to their
+        # formatted results, shared by every sample this evaluator processes.
+        # cache_size=None makes it unbounded and cache_size=0 disables it
+        self.cache_size = cache_size
+        self.__cached_evaluate = functools.lru_cache(maxsize=cache_size)(self.__evaluate_subexpression)
+        # When set, eval_steps are returned as delta-encoded CompactSteps
+        # instead of a dict of full step strings
+        self.compact_steps = compact_steps
+        # Optional PipelineStats collecting failures, the time spent in the
+        # precedence search, evaluation and reformatting of each step, and
+        # the number of steps per expression
+        self.stats = stats
 
     """ Converts a list of symbol occurrences to a dictionary giving
         the total number of occurences for each symbol. Used for 
@@ -128,66 +179,220 @@ class ExpressionEvaluator():
                                "-" in expression_str  and \
                                  self.precedence_eval.is_constant(expression_str)
         return expression_is_solved
+
+    """ Expands scientific notation and reinserts whitespace into an
+        expression in a single tokenizer pass, returning the rendered step and
+        whether it is solved. Falls back to the regex helpers for strings
+        outside the expression grammar """
+    def __render_step(self, expression_str):
+        if "e" in expression_str or "E" in expression_str:
+            expression_str = convert_sci_notation_terms(expression_str)
+        tokens = tokenize(expression_str)
+        if tokens is None:
+            expression_str = self.__insert_whitespace(expression_str, self.whitespace_amount)
+            return expression_str, self.__is_solved(expression_str)
+        num_operators = count_operators(expression_str, tokens)
+        expression_str = render(tokens, self.whitespace_amount)
+        expression_is_solved = num_operators == 0 or \
+                               "-" in expression_str and \
+                                 self.precedence_eval.is_constant(expression_str)
+        return expression_str, expression_is_solved
+    """ Operator and operand counts of an expression from a single tokenizer
+        pass, falling back to the regex helpers for strings outside the
+        expression grammar """
+    def get_counts(self, expression_str):
+        tokens = tokenize(expression_str)
+        if tokens is None:
+            return self.__get_operator_counts(expression_str), self.__get_operand_counts(expression_str)
+        return count_symbols(tokens)
     
+    """ Evaluates an atomic subexpression and returns its result as a string,
+        ready to be substituted back into the expression """
+    def __evaluate_subexpression(self, subexpr):
+        subexpr_value = self.rational_eval.evaluate(subexpr)
+        if subexpr_value is None:
+            raise ZeroDivisionError(f"Subexpression {subexpr!r} has no finite value")
+        if self.cross_check and not self.rational_eval.agrees_with_sympy(subexpr, subexpr_value):
+            raise RuntimeError(f"Rational evaluator disagrees with sympy on {subexpr!r}")
+        return self.rational_eval.format_result(subexpr_value)
+
+    """ Returns the hits, misses, maxsize and current size of the atomic
+        subexpression cache """
+    def cache_info(self):
+        return self.__cached_evaluate.cache_info()
+    def cache_clear(self):
+        self.__cached_evaluate.cache_clear()
+
     """ Converts the string form describing the expression to a dictionary of 
         steps where each key is the step index and each value is the string
         describing the partially simplified expression for that step"""
     def __get_eval_steps(self, expression_str):
-        eval_steps = {}
-        i = 0
+        return dict(enumerate(self.iter_steps(expression_str)))
+    """ Lazily yields the steps to solve an expression, each one as soon as it
+        is computed, so consumers that only need the first few steps pay only
+        for those. The counts are not computed here; see get_counts """
+    def iter_steps(self, expression_str):
+        if self.engine == "tree":
+            return self.__iter_steps_tree(expression_str)
+        return self.__iter_steps_string(expression_str)
+    def __iter_steps_string(self, expression_str):
         # print("\n\n\nOriginal expression:", expression_str)
 
-        while not self.__is_solved(expression_str):
+        stats = self.stats
+        expression_is_solved = self.__is_solved(expression_str)
+        while not expression_is_solved:
+            if stats is not None:
+                start = time.perf_counter()
             # Remove whitespace for ease of evaluation
             expression_str = expression_str.replace(" ", "")
-            self.precedence_eval.was_add_or_sub = False
-            self.precedence_eval.was_double_negative = False
             # Determine the highest precedence subexpression within the
             # expression string
-            next_subexpr, start_idx, end_idx = \
-                self.precedence_eval.next_subexpression(expression_str)
+            next_subexpr, start_idx, end_idx, was_add_or_sub, was_double_negative = \
+                self.precedence_eval.locate(expression_str)
+            if stats is not None:
+                searched = time.perf_counter()
             # Solve the atomic subexpression
             # print("expression so far:", expression_str)
             # print("sub expression:", next_subexpr)
-            subexp = sp.sympify(next_subexpr)
-            subexpr_result = str(float(subexp.evalf())) # float needed due to sympys unnecessary precision
+            subexpr_result = self.__cached_evaluate(next_subexpr)
+            if stats is not None:
+                evaluated = time.perf_counter()
             ## Substitute the result back into the original expression
             # Add addition character back into the expression if there was a double negative
             # or if there was an addition or subtraction operation with the first operand being negative
             addition_char = ""
-            if (self.precedence_eval.was_add_or_sub and start_idx != 0)\
-                or self.precedence_eval.was_double_negative:
+            if (was_add_or_sub and start_idx != 0) or was_double_negative:
                 addition_char = "+"
             expression_str = expression_str[:start_idx] + addition_char + subexpr_result \
                             + expression_str[end_idx+1:]
             # Convert any values in from scientific notation to standard form
-            expression_str = convert_sci_notation_terms(expression_str)
-
-            # Reinsert the desired level of whitespace
-            expression_str = self.__insert_whitespace(expression_str, self.whitespace_amount)
-            eval_steps[i] = expression_str
-            i +=1
-        return eval_steps
+            # and reinsert the desired level of whitespace
+            expression_str, expression_is_solved = self.__render_step(expression_str)
+            if stats is not None:
+                stats.add_time("precedence_search", searched - start)
+                stats.add_time("evaluate", evaluated - searched)
+                stats.add_time("reformat", time.perf_counter() - evaluated)
+            yield expression_str
+    """ Tree engine counterpart of __iter_steps_string: the expression is parsed
+        once and each step is reduced in place and rendered from the tree,
+        producing the same steps as the string engine """
+    def __iter_steps_tree(self, expression_str):
+        expression_tree = ExpressionTree(expression_str)
+        stats = self.stats
+        while not expression_tree.is_solved():
+            if stats is not None:
+                start = time.perf_counter()
+            next_subexpr = expression_tree.next_subexpression()
+            if stats is not None:
+                searched = time.perf_counter()
+            subexpr_result = self.__cached_evaluate(next_subexpr)
+            if stats is not None:
+                evaluated = time.perf_counter()
+            if self.numeric_mode == "float":
+                subexpr_result = convert_sci_notation_terms(subexpr_result)
+            expression_tree.substitute(subexpr_result)
+            step = expression_tree.render(self.whitespace_amount)
+            if stats is not None:
+                stats.add_time("precedence_search", searched - start)
+                stats.add_time("evaluate", evaluated - searched)
+                stats.add_time("reformat", time.perf_counter() - evaluated)
+            yield step
     """ Generates the operator counts, operand counts, and the steps for a given 
         raw expression sample. Returns dictionary mapping the expression to 
         these three dictionaries """
     def process_sample(self, raw_sample_str):
         eval_steps =  self.__get_eval_steps(raw_sample_str)
-        operator_counts = self.__get_operator_counts(raw_sample_str)
-        operand_counts = self.__get_operand_counts(raw_sample_str)
+        if self.stats is not None:
+            self.stats.record_steps(len(eval_steps))
+        if self.compact_steps:
+            eval_steps = CompactSteps.from_steps(raw_sample_str, eval_steps)
+        operator_counts, operand_counts = self.get_counts(raw_sample_str)
 
         return (eval_steps, operator_counts, operand_counts)
-    """ Generates the dataset of arithmetic expressions with the steps to solve them """
-    def process_dataset(self):
-        for __, raw_sample in list(self.__raw_dataset.items()):
+    """ Processes raw expression samples one at a time as they arrive (e.g. from
+        ExpressionGenerator.generate_iter), yielding each raw sample along with
+        its processed record """
+    def process_iter(self, raw_samples):
+        for raw_sample in raw_samples:
+            eval_steps, operator_counts, operand_counts = self.process_sample(raw_sample)
+            yield raw_sample, {"eval_steps": eval_steps,
+                               "operator_counts": operator_counts,
+                               "operand_counts": operand_counts}
+    """ Processes a single raw sample, returning (raw sample, processed record, None)
+        or (raw sample, None, error message) instead of raising """
+    def process_sample_safely(self, raw_sample):
+        try:
             eval_steps, operator_counts, operand_counts = self.process_sample(raw_sample)
-            self.__processed_dataset[raw_sample] = {"eval_steps": eval_steps,
-                                                    "operator_counts": operator_counts,
-                                                    "operand_counts": operand_counts}
+        except Exception as error:
+            return raw_sample, None, f"{type(error).__name__}: {error}"
+        return raw_sample, {"eval_steps": eval_steps,
+                            "operator_counts": operator_counts,
+                            "operand_counts": operand_counts}, None
+    """ Keyword arguments needed to recreate this evaluator's settings in a
+        worker process """
+    def __worker_kwargs(self):
+        return {"whitespace_amount": self.whitespace_amount,
+                "cross_check": self.cross_check,
+                "engine": self.engine,
+                "cache_size": self.cache_size,
+                "compact_steps": self.compact_steps,
+                "numeric_mode": self.numeric_mode,
+                "decimal_places": self.decimal_places,
+                "rounding": self.rounding,
+                "stats": PipelineStats() if self.stats is not None else None}
+    """ Yields (raw sample, processed record, error) in input order, spreading
+        the samples over num_workers processes in chunks of chunk_size """
+    def __process_samples(self, raw_samples, num_workers, chunk_size, progress_callback):
+        total = len(raw_samples)
+        chunks = [raw_samples[i:i + chunk_size] for i in range(0, total, chunk_size)]
+        num_done = 0
+        if num_workers <= 1:
+            results_per_chunk = (map(self.process_sample_safely, chunk) for chunk in chunks)
+            for results in results_per_chunk:
+                for result in results:
+                    num_done += 1
+                    yield result
+                if progress_callback is not None:
+                    progress_callback(num_done, total)
+            return
+        with multiprocessing.Pool(num_workers, initializer=init_worker,
+                                  initargs=(self.__worker_kwargs(),)) as pool:
+            # imap returns chunk results in submission order
+            for results, chunk_stats in pool.imap(process_chunk, chunks):
+                if chunk_stats is not None:
+                    self.stats.merge(chunk_stats)
+                num_done += len(results)
+                yield from results
+                if progress_callback is not None:
+                    progress_callback(num_done, total)
+    """ Generates the dataset of arithmetic expressions with the steps to solve them.
+        With num_workers > 1 the samples are processed by a pool of worker
+        processes; the output keeps the order of the raw dataset either way.
+        Samples that raise are left out and recorded in self.failed_samples.
+        progress_callback, if given, is called as progress_callback(num_done, total)
+        after every chunk.
+        If a sink (see DatasetWriter) is given, each processed sample is written
+        to it as soon as it is done rather than kept in memory, and samples the
+        sink already holds from an earlier run are skipped """
+    def process_dataset(self, num_workers=1, chunk_size=256, progress_callback=None, sink=None):
+        raw_samples = list(self.__raw_dataset.values())
+        if sink is not None:
+            raw_samples = [raw_sample for raw_sample in raw_samples if raw_sample not in sink]
+        for raw_sample, processed_sample, error in self.__process_samples(
+                raw_samples, num_workers, chunk_size, progress_callback):
+            if self.stats is not None:
+                # Failure reason is the exception type, e.g. "ZeroDivisionError"
+                self.stats.record_processed(None if error is None else error.split(":", 1)[0])
+            if error is not None:
+                self.failed_samples[raw_sample] = error
+            elif sink is not None:
+                sink.write(raw_sample, processed_sample)
+            else:
+                self.__processed_dataset[raw_sample] = processed_sample
         return self.__processed_dataset
 
-
 def main():
+    import sympy as sp
     max_val = 12
     # raw_datagen = ExpressionGenerator(num_samples=10000, min_value=-max_val, max_value=max_val, max_nesting=4)
     # raw_dataset = raw_datagen.generate_dataset()
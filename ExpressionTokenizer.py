@@ -0,0 +1,81 @@
+###############################################################################
+## Description: Single-pass tokenizer for arithmetic expression strings.     ##
+##              One precompiled regex splits a string into a token stream    ##
+##              from which the operator/operand counts, the number of        ##
+##              operators left and the whitespace-normalized rendering of a  ##
+##              step are all derived, matching ExpressionEvaluator's regex   ##
+##              based helpers exactly.                                       ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import re
+
+# Splitting on the symbols (operators, parentheses and spaces) while keeping
+# them yields an alternating stream: even positions hold the operand text
+# between two symbols (possibly empty), odd positions hold one symbol
+SYMBOL_SPLIT_REGEX = re.compile(r'([\^\*/\+\-\(\) ])')
+# Anything other than digits, decimal points and symbols (letters, exponents,
+# tabs, ...) is left to the regex based helpers
+UNSUPPORTED_CHAR_REGEX = re.compile(r'[^0-9\. \^\*/\+\-\(\)]')
+SCI_NOTATION_REGEX = re.compile(r'\b\d+\.?\d*[eE][+-]?\d+\b')
+
+def expand_sci_notation(number_str):
+    """Write a number given in scientific notation (e.g. 2.541e-05) without it."""
+    return '{:f}'.format(float(number_str)).rstrip('0').rstrip('.')
+
+def tokenize(expression_str):
+    """Split an expression string into its alternating operand/symbol token
+    stream, or return None if it contains characters outside the grammar."""
+    if UNSUPPORTED_CHAR_REGEX.search(expression_str):
+        return None
+    return SYMBOL_SPLIT_REGEX.split(expression_str)
+
+def count_symbols(tokens):
+    """Return (operator_counts, operand_counts) for a token stream: every
+    operator/parenthesis, and every run of digits in the operands."""
+    operator_counts = {}
+    operand_counts = {}
+    for i, token in enumerate(tokens):
+        if i % 2:
+            if token != " ":
+                operator_counts[token] = operator_counts.get(token, 0) + 1
+        elif token:
+            for digits in token.split("."):
+                if digits:
+                    operand_counts[digits] = operand_counts.get(digits, 0) + 1
+    return operator_counts, operand_counts
+
+def count_operators(expression_str, tokens):
+    """Number of operators and parentheses in the string the tokens came from."""
+    return len(tokens) // 2 - expression_str.count(" ")
+
+def render(tokens, num_spaces=1):
+    """Render a token stream with num_spaces spaces around + * / and around -
+    when it is a subtraction (preceded by a digit or ')' and followed by an
+    operand), collapsing any runs of spaces."""
+    space = " " * num_spaces
+    parts = [tokens[0]]
+    ends_with_space = False
+    for i in range(1, len(tokens), 2):
+        symbol = tokens[i]
+        if symbol == "-":
+            preceding = tokens[i - 1]
+            is_spaced = tokens[i + 1] != "" and \
+                        (preceding[-1:].isdigit() or (preceding == "" and i >= 2 and tokens[i - 2] == ")"))
+        else:
+            is_spaced = symbol in "+*/ "
+        if is_spaced:
+            if not ends_with_space:
+                parts.append(space)
+            if symbol != " ":
+                parts.append(symbol)
+                parts.append(space)
+            ends_with_space = True
+        else:
+            parts.append(symbol)
+            ends_with_space = False
+        operand = tokens[i + 1]
+        if operand:
+            parts.append(operand)
+            ends_with_space = False
+    return "".join(parts)
@@ -0,0 +1,164 @@
+###############################################################################
+## Description: Defines a parse-once representation of an arithmetic        ##
+##              expression that finds and reduces its highest precedence     ##
+##              atomic subexpression in place, following the same rules as   ##
+##              PrecedenceEvaluator, and renders each intermediate step      ##
+##              without rescanning or re-splicing the expression string     ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import re
+
+OPERATORS = ("^", "*", "/", "+", "-")
+
+# Unsigned numbers, operators and parentheses; signs are attached to numbers
+# while building the tree
+TOKEN_REGEX = re.compile(r'\d+\.?\d*|\.\d+|[\^\*/\+\-\(\)]')
+
+class Group:
+    """A parenthesised subexpression: a flat list of number strings, operator
+    strings and nested Groups."""
+    __slots__ = ("items", "parent")
+    def __init__(self, parent=None):
+        self.items = []
+        self.parent = parent
+
+class ExpressionTree:
+    def __init__(self, expression_str):
+        self.root = self.__parse(expression_str.replace(" ", ""))
+        # Replacement recorded by next_subexpression for use by substitute
+        self.__pending = None
+
+    def __parse(self, expression_str):
+        root = Group()
+        group = root
+        pos = 0
+        sign = ""
+        prev = None # Previous token, used to tell unary from binary minus
+        for match in TOKEN_REGEX.finditer(expression_str):
+            if match.start() != pos:
+                raise ValueError(f"Unexpected character in expression: {expression_str!r}")
+            token = match.group()
+            pos = match.end()
+            is_unary_position = prev is None or prev in OPERATORS or prev == "("
+            if token == "-" and is_unary_position and not sign:
+                sign = "-"
+                prev = token
+                continue
+            if sign and not (token[0].isdigit() or token[0] == "."):
+                raise ValueError(f"Unsupported unary minus in expression: {expression_str!r}")
+            if token == "(":
+                child = Group(group)
+                group.items.append(child)
+                group = child
+            elif token == ")":
+                if group.parent is None:
+                    raise ValueError(f"Unbalanced parentheses in expression: {expression_str!r}")
+                group = group.parent
+            elif token in OPERATORS:
+                if is_unary_position:
+                    raise ValueError(f"Unsupported unary operator in expression: {expression_str!r}")
+                group.items.append(token)
+            else:
+                group.items.append(sign + token)
+                sign = ""
+            prev = token
+        if pos != len(expression_str) or group is not root or sign:
+            raise ValueError(f"Malformed expression: {expression_str!r}")
+        return root
+
+    def __deepest_group(self):
+        """Return the leftmost of the most deeply nested groups, or the root if there are none."""
+        deepest, deepest_level = self.root, 0
+        stack = [(self.root, 0)]
+        while stack:
+            group, level = stack.pop()
+            if level > deepest_level:
+                deepest, deepest_level = group, level
+            # Push children in reverse so they are visited left to right
+            for item in reversed(group.items):
+                if isinstance(item, Group):
+                    stack.append((item, level + 1))
+        return deepest
+
+    def is_solved(self):
+        """An expression is solved once it is a single constant (optionally a
+        parenthesised negative constant, as for PrecedenceEvaluator.is_constant)."""
+        items = self.root.items
+        if len(items) != 1:
+            return False
+        if isinstance(items[0], Group):
+            inner = items[0].items
+            return len(inner) == 1 and isinstance(inner[0], str) and inner[0].startswith("-")
+        return True
+
+    def next_subexpression(self):
+        """Locate the highest precedence atomic subexpression and return its string form.
+
+        The location is remembered so that the following call to substitute
+        can splice the subexpression's result back into the tree.
+        """
+        group = self.__deepest_group()
+        items = group.items
+        # A parenthesised constant is unwrapped into its parent
+        if len(items) == 1 and group.parent is not None:
+            self.__pending = (group.parent.items, group.parent.items.index(group), 1, "")
+            return items[0]
+        # Double negatives (e.g. 5 - -2) take priority and become an addition
+        for k in range(1, len(items), 2):
+            if items[k] == "-" and items[k + 1].startswith("-"):
+                self.__pending = (items, k, 2, "+")
+                return "-" + items[k + 1]
+        for operators in (("^",), ("*", "/")):
+            for k in range(1, len(items), 2):
+                if items[k] in operators:
+                    self.__pending = (items, k - 1, 3, "")
+                    return items[k - 1] + items[k] + items[k + 1]
+        add_k = next((k for k in range(1, len(items), 2) if items[k] == "+"), None)
+        sub_k = next((k for k in range(1, len(items), 2) if items[k] == "-"), None)
+        # Additions are performed first if they come before any subtraction,
+        # or if the leading "-" is only the sign of a negative first operand
+        if add_k is not None and (sub_k is None or add_k < sub_k or items[0].startswith("-")):
+            if add_k >= 3 and items[add_k - 2] == "-":
+                # The subtraction sign before the left operand becomes its sign
+                self.__pending = (items, add_k - 2, 4, "+")
+                return "-" + items[add_k - 1] + "+" + items[add_k + 1]
+            self.__pending = (items, add_k - 1, 3, "")
+            return items[add_k - 1] + "+" + items[add_k + 1]
+        if sub_k is not None:
+            self.__pending = (items, sub_k - 1, 3, "")
+            return items[sub_k - 1] + "-" + items[sub_k + 1]
+        raise ValueError("Expression has no subexpression left to evaluate")
+
+    def substitute(self, result_str):
+        """Replace the subexpression found by next_subexpression with its result."""
+        if self.__pending is None:
+            raise RuntimeError("next_subexpression must be called before substitute")
+        items, start, length, addition_char = self.__pending
+        self.__pending = None
+        items[start:start + length] = [addition_char, result_str] if addition_char else [result_str]
+
+    def __render_items(self, items, space, parts):
+        for i, item in enumerate(items):
+            if isinstance(item, Group):
+                parts.append("(")
+                self.__render_items(item.items, space, parts)
+                parts.append(")")
+            elif item in ("+", "*", "/"):
+                parts.append(space + item + space)
+            elif item == "-":
+                # Subtraction is only spaced out when followed by an unsigned
+                # number, as in ExpressionEvaluator's whitespace rules
+                following = items[i + 1]
+                if isinstance(following, str) and not following.startswith("-"):
+                    parts.append(space + "-" + space)
+                else:
+                    parts.append("-")
+            else:
+                parts.append(item)
+
+    def render(self, num_spaces=1):
+        """Render the current state of the expression with the given spacing around operators."""
+        parts = []
+        self.__render_items(self.root.items, " " * num_spaces, parts)
+        return "".join(parts)
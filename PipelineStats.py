@@ -0,0 +1,106 @@
+###############################################################################
+## Description: Defines a lightweight statistics collector that can be       ##
+##              attached to ExpressionGenerator and ExpressionEvaluator. It  ##
+##              counts rejected candidates and failed samples by reason,     ##
+##              each against its own total, accumulates the time spent in    ##
+##              each pipeline stage and keeps histograms of expression       ##
+##              lengths and steps per expression. Recording is a few dict    ##
+##              updates, so it is cheap enough to leave on.                  ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+# Pipeline stages, in the order they run
+STAGES = ("generate", "validate", "precedence_search", "evaluate", "reformat")
+
+class PipelineStats:
+    def __init__(self):
+        # Generator: reason (e.g. "duplicate", "undefined") -> number of
+        # rejected candidates
+        self.rejects = {}
+        # Evaluator: reason (exception type) -> number of samples that failed
+        # to process, and the number of samples processed, failed or not
+        self.failures = {}
+        self.num_processed = 0
+        # Stage -> cumulative seconds, and stage -> number of timed calls
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        # Value -> number of expressions with that value
+        self.length_histogram = {}
+        self.steps_histogram = {}
+        self.num_accepted = 0
+    def reject(self, reason):
+        self.rejects[reason] = self.rejects.get(reason, 0) + 1
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+    def accept(self, expression_str):
+        """Record an expression accepted by the generator."""
+        self.num_accepted += 1
+        length = len(expression_str)
+        self.length_histogram[length] = self.length_histogram.get(length, 0) + 1
+    def record_processed(self, failure_reason=None):
+        """Record a sample processed by the evaluator, and why it failed if it did."""
+        self.num_processed += 1
+        if failure_reason is not None:
+            self.failures[failure_reason] = self.failures.get(failure_reason, 0) + 1
+    def record_steps(self, num_steps):
+        self.steps_histogram[num_steps] = self.steps_histogram.get(num_steps, 0) + 1
+    def merge(self, other):
+        """Add the counts and timings collected by another instance (e.g. a worker process)."""
+        for reason, count in other.rejects.items():
+            self.rejects[reason] = self.rejects.get(reason, 0) + count
+        for reason, count in other.failures.items():
+            self.failures[reason] = self.failures.get(reason, 0) + count
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        for stage, calls in other.stage_calls.items():
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + calls
+        for value, count in other.length_histogram.items():
+            self.length_histogram[value] = self.length_histogram.get(value, 0) + count
+        for value, count in other.steps_histogram.items():
+            self.steps_histogram[value] = self.steps_histogram.get(value, 0) + count
+        self.num_accepted += other.num_accepted
+        self.num_processed += other.num_processed
+        return self
+    def rejection_rate(self):
+        """Fraction of generated candidates that were rejected."""
+        num_rejected = sum(self.rejects.values())
+        total = num_rejected + self.num_accepted
+        return num_rejected / total if total else 0.0
+    def failure_rate(self):
+        """Fraction of the samples processed by the evaluator that failed."""
+        return sum(self.failures.values()) / self.num_processed if self.num_processed else 0.0
+    def as_dict(self):
+        """JSON-serializable snapshot of the collected statistics."""
+        return {"num_accepted": self.num_accepted,
+                "rejects": dict(self.rejects),
+                "rejection_rate": self.rejection_rate(),
+                "num_processed": self.num_processed,
+                "failures": dict(self.failures),
+                "failure_rate": self.failure_rate(),
+                "stage_seconds": dict(self.stage_seconds),
+                "stage_calls": dict(self.stage_calls),
+                "length_histogram": dict(sorted(self.length_histogram.items())),
+                "steps_histogram": dict(sorted(self.steps_histogram.items()))}
+    def summary(self):
+        """Human readable multi-line report."""
+        lines = []
+        if self.num_accepted or self.rejects:
+            lines.append(f"accepted: {self.num_accepted}  rejection rate: {self.rejection_rate():.2%}")
+            for reason, count in sorted(self.rejects.items(), key=lambda item: -item[1]):
+                lines.append(f"  rejected ({reason}): {count}")
+        if self.num_processed:
+            lines.append(f"processed: {self.num_processed}  failure rate: {self.failure_rate():.2%}")
+            for reason, count in sorted(self.failures.items(), key=lambda item: -item[1]):
+                lines.append(f"  failed ({reason}): {count}")
+        ordered_stages = [stage for stage in STAGES if stage in self.stage_seconds] + \
+                         sorted(set(self.stage_seconds) - set(STAGES))
+        for stage in ordered_stages:
+            seconds, calls = self.stage_seconds[stage], self.stage_calls[stage]
+            lines.append(f"  {stage}: {seconds:.4f} s over {calls} calls ({seconds / calls * 1e6:.2f} us/call)")
+        for name, histogram in (("length", self.length_histogram), ("steps", self.steps_histogram)):
+            if histogram:
+                count = sum(histogram.values())
+                mean = sum(value * n for value, n in histogram.items()) / count
+                lines.append(f"  {name}: mean {mean:.2f}, min {min(histogram)}, max {max(histogram)}")
+        return "\n".join(lines)
@@ -1,18 +1,44 @@
 ###############################################################################
 ## Decription: Defines a class to take an arithmetic expression string and   ##
 ##             determine and return the atomic subexpression within it       ##
-##             having highest precedence                                     ## 
-## Last Modified: 11 March 2024                                              ##
+##             having highest precedence. The search keeps its bookkeeping   ##
+##             in a per-call state, so one instance can be shared between    ##
+##             threads.                                                      ##
+## Last Modified: 17 October 2026                                            ##
 ###############################################################################
 import re
+from collections import namedtuple
+
+""" Immutable result of a search: the subexpression, its start and end index
+    within the expression string, whether it is an addition/subtraction whose
+    first operand follows another operator, and whether it is a double
+    negative (e.g. --2). Either flag means a "+" has to be put back in front
+    of the result when it is substituted into the expression """
+Subexpression = namedtuple("Subexpression", ["subexpression", "start", "end",
+                                             "was_add_or_sub", "was_double_negative"])
+
+""" Bookkeeping of a single search, updated as the subexpression is narrowed
+    down """
+class SearchState:
+    __slots__ = ("last_subexpr_start", "last_subexpr_end", "is_parenth_operation",
+                 "was_add_or_sub", "was_double_negative")
+    def __init__(self):
+        self.last_subexpr_start = 0
+        self.last_subexpr_end = 0
+        self.is_parenth_operation = False
+        self.was_add_or_sub = False
+        self.was_double_negative = False
+
 class PrecedenceEvaluator:
     def __init__(self):
-        self.__last_subexpr_start = 0
-        self.__last_subexpr_end = 0
         self.__operators = ["^", "*", "/", "+", "-"]
+        # Flags set by next_subexpression, the legacy API; callers reset them
+        # before each call. locate returns them in its result instead
+        self.was_add_or_sub = False
+        self.was_double_negative = False
 
 
-    def __extract_operation(self, expression_str, op_idx, add_paren_offset = True):
+    def __extract_operation(self, state, expression_str, op_idx, add_paren_offset = True):
         start = op_idx - 1
         while start > 0 and (expression_str[start].isdigit() 
                              or expression_str[start] == ".") :
@@ -37,7 +63,7 @@ class PrecedenceEvaluator:
 
                 is_first_op_neg = False
             else:
-                self.was_add_or_sub = True
+                state.was_add_or_sub = True
 
 
         # Index finding loops go one index past last digit; come back one
@@ -54,45 +80,46 @@ class PrecedenceEvaluator:
         len_start_paren = 0
         if add_paren_offset:
             len_start_paren = 1
-        if self.__is_parenth_operation:
-            self.__last_subexpr_end = self.__last_subexpr_start + end + \
+        if state.is_parenth_operation:
+            state.last_subexpr_end = state.last_subexpr_start + end + \
                             len_start_paren
-            self.__last_subexpr_start = self.__last_subexpr_start + start + \
+            state.last_subexpr_start = state.last_subexpr_start + start + \
                                         len_start_paren
 
-        if not self.__is_parenth_operation:
-            self.__last_subexpr_start = start
-            self.__last_subexpr_end = end
+        if not state.is_parenth_operation:
+            state.last_subexpr_start = start
+            state.last_subexpr_end = end
 
 
         sub_exp = expression_str[start:end+1]
         return sub_exp
     
+    """ Lists every parenthesis-enclosed subexpression as (subexpression, nesting
+        level, start index, end index), in order of their opening parenthesis.
+        Parentheses are matched with a stack in a single pass; a closing
+        parenthesis without an opening one is skipped """
     def __determine_nested_levels(self, expression_str):
         nested_levels_list = []
+        # Positions in nested_levels_list of the groups not closed yet
+        open_groups = []
         nested_level = 0
-        i = 0
-        end_index = -1 # We don't know where subexpression ends until reaching
-                       # the terminating parenthesis
-        while i < len(expression_str):
-            if expression_str[i] == '(':
-                start_idx = i
-                end_idx = -1
-                nested_levels_list.append(("", nested_level, start_idx, end_idx))
+        for i, char in enumerate(expression_str):
+            if char == '(':
+                open_groups.append(len(nested_levels_list))
+                # We don't know where subexpression ends until reaching
+                # the terminating parenthesis
+                nested_levels_list.append(("", nested_level, i, -1))
                 nested_level += 1
-            elif expression_str[i] == ')':
+            elif char == ')':
                 nested_level -= 1
-                start_index = None
-                for j in range(len(nested_levels_list) - 1, -1, -1):
-                    if nested_levels_list[j][1] == nested_level:
-                        start_index = nested_levels_list[j][2]
-                        end_index = i
-                        nested_levels_list[j] = (expression_str[start_index:end_index+1], nested_level, start_index, end_index)
-                        break
-            i += 1
+                # Only the innermost open group can be closed, and only from its own level
+                if open_groups and nested_levels_list[open_groups[-1]][1] == nested_level:
+                    j = open_groups.pop()
+                    start_index = nested_levels_list[j][2]
+                    nested_levels_list[j] = (expression_str[start_index:i+1], nested_level, start_index, i)
         return nested_levels_list
 
-    def __extract_parenth_expr(self, expression_str):
+    def __extract_parenth_expr(self, state, expression_str):
         nested_levels_list = self.__determine_nested_levels(expression_str)
         if not nested_levels_list:
             return ""
@@ -100,8 +127,8 @@ class PrecedenceEvaluator:
         # Store where the parenthesis expression occurs within the string
         start_idx = most_nested_exp[2]
         end_idx = most_nested_exp[3]
-        self.__last_subexpr_start = start_idx
-        self.__last_subexpr_end = end_idx
+        state.last_subexpr_start = start_idx
+        state.last_subexpr_end = end_idx
         return most_nested_exp[0]
     
     """ Determines if double negative exists in given expression """
@@ -115,7 +142,7 @@ class PrecedenceEvaluator:
         E.g., 5 - -2. and returns the two indices locating it within the 
         expression. Used to sub cases like --2 for +2
     """
-    def __extract_double_negative(self, expression_str):
+    def __extract_double_negative(self, state, expression_str):
         match = re.search(r'-\s*-\s*\d+(\.\d+)?', expression_str)
         if match:
             # Extracting the match without spaces for clarity and calculating indices
@@ -125,34 +152,34 @@ class PrecedenceEvaluator:
             len_start_paren = 1
             """ Refactor this. At the very least, come back and provide names to
                 the constants """
-            if self.__is_parenth_operation:
-                self.__last_subexpr_end = self.__last_subexpr_start + end -1\
+            if state.is_parenth_operation:
+                state.last_subexpr_end = state.last_subexpr_start + end -1\
                                 
-                self.__last_subexpr_start = self.__last_subexpr_start + start + \
+                state.last_subexpr_start = state.last_subexpr_start + start + \
                                             len_start_paren + 1
             else:
-                self.__last_subexpr_start = start
-                self.__last_subexpr_end = end
+                state.last_subexpr_start = start
+                state.last_subexpr_end = end
             return extracted
         else:
             return ""
-    def __extract_exponentiation(self, expression_str):
+    def __extract_exponentiation(self, state, expression_str):
         idx = expression_str.find('^')
         if idx != -1:
-            return self.__extract_operation(expression_str, idx)
+            return self.__extract_operation(state, expression_str, idx)
         return ""
 
-    def __extract_mult_divis(self, expression_str):
+    def __extract_mult_divis(self, state, expression_str):
         mult_idx = expression_str.find('*')
         div_idx = expression_str.find('/')
         if mult_idx == -1 and div_idx == -1:
             return ""
         if mult_idx != -1 and (div_idx == -1 or mult_idx < div_idx):
-            return self.__extract_operation(expression_str, mult_idx)
+            return self.__extract_operation(state, expression_str, mult_idx)
         if div_idx != -1:
-            return self.__extract_operation(expression_str, div_idx)
+            return self.__extract_operation(state, expression_str, div_idx)
         
-    def __extract_add_sub(self, expression_str):
+    def __extract_add_sub(self, state, expression_str):
         add_idx = expression_str.find('+')
         sub_idx = expression_str.find('-')
         if add_idx == -1 and sub_idx == -1:
@@ -161,13 +188,13 @@ class PrecedenceEvaluator:
         # the subtraction (if exists) of if the "subtraction" is actually 
         # a negative number
         if add_idx != -1 and (sub_idx == -1 or add_idx < sub_idx or \
-                              self.is_constant(self.__extract_operation(expression_str, sub_idx, 
+                              self.is_constant(self.__extract_operation(state, expression_str, sub_idx, 
                                                                         add_paren_offset=False))):
-            return self.__extract_operation(expression_str, add_idx, add_paren_offset = True)
+            return self.__extract_operation(state, expression_str, add_idx, add_paren_offset = True)
         # Otherwise perform the subtraction operation
         if sub_idx != -1:
             # If the expression is a subtraction operation, return it
-            sub_expr =  self.__extract_operation(expression_str, sub_idx, add_paren_offset=True)
+            sub_expr =  self.__extract_operation(state, expression_str, sub_idx, add_paren_offset=True)
             if not self.is_constant(sub_expr):
                 return sub_expr
             # Otherwise if the extracted operation is actually just a negative
@@ -175,7 +202,7 @@ class PrecedenceEvaluator:
             else:
                 next_sub_idx = expression_str.find('-', sub_idx + 1)
                 while (self.is_constant(sub_expr) and next_sub_idx != -1):
-                    sub_expr = self.__extract_operation(expression_str, next_sub_idx, 
+                    sub_expr = self.__extract_operation(state, expression_str, next_sub_idx, 
                                                         add_paren_offset=False)
                 return sub_expr
 
@@ -199,47 +226,70 @@ class PrecedenceEvaluator:
             return False  # The subexpression is not a valid number, hence not a negative constant
 
 
-    """ Returns the highest precedence subexpression and the start and 
-        end index at which it occurs within the expression string"""
-    def next_subexpression(self, expression_str):
+    """ Returns the highest precedence subexpression of the expression string
+        as an immutable Subexpression. Nothing is stored on the instance, so
+        concurrent calls do not interfere"""
+    def locate(self, expression_str):
+        state = SearchState()
         # Flag to track whether the operation is parenthesis operation. This  
         # is only necessary for tracking indices properly for parenthesis expressions
-        self.__is_parenth_operation = False
         if '(' in expression_str or ')' in expression_str:
             # Get the highest precedence parenthesis-enclosed subexpression
             # This subexpression may contain more than one operations;
             # determine its highest precedence operations within it
             # using EMDAS rules 
-            self.__is_parenth_operation = True
-            sub_exp = self.__extract_parenth_expr(expression_str)
+            state.is_parenth_operation = True
+            sub_exp = self.__extract_parenth_expr(state, expression_str)
             # Remove outer parenthesis from the extracted expression and pass it
             # to the next functions
             expression_str = sub_exp[1:-1]
         # Search for any double negatives
         if self.__has_double_negative(expression_str):
-            sub_exp = self.__extract_double_negative(expression_str)
+            sub_exp = self.__extract_double_negative(state, expression_str)
             # Set flag to replace double negative with + in the 
             # Expression Evaluator
-            self.was_double_negative = True
+            state.was_double_negative = True
         elif '^' in expression_str:
-            sub_exp = self.__extract_exponentiation(expression_str)
+            sub_exp = self.__extract_exponentiation(state, expression_str)
         elif '*' in expression_str or '/' in expression_str:
-            sub_exp = self.__extract_mult_divis(expression_str)
+            sub_exp = self.__extract_mult_divis(state, expression_str)
         elif '+' in expression_str or '-' in expression_str:
-            sub_exp = self.__extract_add_sub(expression_str)
+            sub_exp = self.__extract_add_sub(state, expression_str)
         # Otherwise, if the subexpression is a postive or negative constant
         # Remove the parenthesis from the expression
-        if (self.is_constant(sub_exp)) and self.__is_parenth_operation:
+        if (self.is_constant(sub_exp)) and state.is_parenth_operation:
             if sub_exp.startswith("(") and sub_exp.endswith(")"):
                 sub_exp= sub_exp[1:-1]
             " Revisit this; not sure why this fixed issue"
             if sub_exp.startswith("-"):
-                self.__last_subexpr_start -=1
-                if not self.was_double_negative:
-                    self.__last_subexpr_end +=1
+                state.last_subexpr_start -=1
+                if not state.was_double_negative:
+                    state.last_subexpr_end +=1
                 else:
-                    self.__last_subexpr_end +=2
-        return (sub_exp, self.__last_subexpr_start, self.__last_subexpr_end)
+                    state.last_subexpr_end +=2
+        return Subexpression(sub_exp, state.last_subexpr_start, state.last_subexpr_end,
+                             state.was_add_or_sub, state.was_double_negative)
+
+    """ Batch form of locate for a list of expression strings. If an executor
+        (e.g. a concurrent.futures.ThreadPoolExecutor) is given, the
+        expressions are searched on it; results keep the input order """
+    def next_subexpressions(self, expression_strs, executor=None):
+        if executor is None:
+            return [self.locate(expression_str) for expression_str in expression_strs]
+        return list(executor.map(self.locate, expression_strs))
+
+    """ Returns the highest precedence subexpression and the start and 
+        end index at which it occurs within the expression string. Kept for
+        existing callers: it sets was_add_or_sub and was_double_negative on
+        the instance (which the caller resets), so it is not thread safe;
+        prefer locate """
+    def next_subexpression(self, expression_str):
+        result = self.locate(expression_str)
+        if result.was_add_or_sub:
+            self.was_add_or_sub = True
+        if result.was_double_negative:
+            self.was_double_negative = True
+        return (result.subexpression, result.start, result.end)
         
 def main():
     expression = "(3+(2+3+3^4))*(3+2)"
@@ -0,0 +1,360 @@
+###############################################################################
+## Description: Defines a class to exactly evaluate arithmetic expression    ##
+##              strings over the + - * / ^ grammar using rational numbers,   ##
+##              avoiding the cost of a sympy round trip for every candidate  ##
+##              and every evaluation step                                    ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import decimal
+import math
+import re
+from fractions import Fraction
+
+# A token is either a number (integer, decimal or scientific notation) or a
+# single operator/parenthesis character; whitespace between tokens is skipped
+TOKEN_REGEX = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|(\S))')
+
+class UndefinedResult(Exception):
+    """Raised internally when an operation has no real, finite result (e.g. division by zero)."""
+
+def round_ratio(numerator, denominator, prec, toward_zero=False):
+    """Round numerator / denominator (denominator > 0) to prec significant
+    bits, to nearest with ties to even or toward zero, as mpmath does.
+    Returns the numerator and power of two denominator of the result."""
+    magnitude = abs(numerator)
+    if magnitude == 0:
+        return 0, 1
+    # Values of a FloatValue's precision or less are returned as they are
+    if magnitude.bit_length() <= prec and denominator & (denominator - 1) == 0:
+        return numerator, denominator
+    # The scaled quotient has prec or prec + 1 bits; in the second case one
+    # more bit is shifted out
+    shift = prec - (magnitude.bit_length() - denominator.bit_length())
+    for shift in (shift, shift - 1):
+        if shift >= 0:
+            divisor = denominator
+            quotient, remainder = divmod(magnitude << shift, divisor)
+        else:
+            divisor = denominator << -shift
+            quotient, remainder = divmod(magnitude, divisor)
+        if quotient.bit_length() <= prec:
+            break
+    if not toward_zero and (2 * remainder > divisor or 2 * remainder == divisor and quotient & 1):
+        quotient += 1
+    if numerator < 0:
+        quotient = -quotient
+    return (quotient, 1 << shift) if shift >= 0 else (quotient << -shift, 1)
+
+class FloatValue(Fraction):
+    """A value of the "float" mode that sympy would hold as a Float: an
+    approximation carried at prec bits, which sets the precision of every
+    operation it takes part in."""
+    __slots__ = ("prec",)
+    def __new__(cls, numerator, denominator, prec):
+        self = super().__new__(cls, numerator, denominator)
+        self.prec = prec
+        return self
+    @classmethod
+    def rounded(cls, value, prec):
+        """value (a Fraction) rounded to a prec-bit FloatValue."""
+        return cls(*round_ratio(value.numerator, value.denominator, prec), prec)
+    def __reduce__(self):
+        return (type(self), (self.numerator, self.denominator, self.prec))
+
+def digits_to_bits(num_digits):
+    """Binary precision of num_digits decimal digits (mpmath's dps_to_prec)."""
+    return max(1, int(round((num_digits + 1) * 3.32192809488736234787)))
+
+# Precision of sympy's Floats: at least 15 digits (53 bits), more for longer
+# literals, and evalf() rounds results to 53 bits; exact (Integer/Rational)
+# results are first truncated to 53 + 4 bits, evalf's working precision
+MIN_FLOAT_DIGITS = 15
+DOUBLE_BITS = 53
+EVALF_GUARD_BITS = 4
+
+# How step results are represented: "float" formats them as str(float(...))
+# like the sympy based pipeline, rounding every value the way sympy's Floats
+# are rounded; "fraction" keeps every value exact and "decimal" rounds results
+# to a fixed number of decimal places, both reading decimal literals exactly
+NUMERIC_MODES = ("float", "fraction", "decimal")
+ROUNDING_MODES = (decimal.ROUND_HALF_EVEN, decimal.ROUND_HALF_UP, decimal.ROUND_HALF_DOWN, decimal.ROUND_UP,
+                  decimal.ROUND_DOWN, decimal.ROUND_CEILING, decimal.ROUND_FLOOR, decimal.ROUND_05UP)
+
+class RationalEvaluator:
+    def __init__(self, numeric_mode="float", decimal_places=6, rounding=decimal.ROUND_HALF_EVEN):
+        if numeric_mode not in NUMERIC_MODES:
+            raise ValueError(f"Unknown numeric mode: {numeric_mode!r}")
+        if rounding not in ROUNDING_MODES:
+            raise ValueError(f"Unknown rounding mode: {rounding!r}")
+        if decimal_places < 0:
+            raise ValueError("decimal_places must not be negative")
+        self.numeric_mode = numeric_mode
+        # Used by the "decimal" mode only
+        self.decimal_places = decimal_places
+        self.rounding = rounding
+        self.__quantum = decimal.Decimal(1).scaleb(-decimal_places)
+    def tokenize(self, expression_str):
+        """Split an expression string into a list of number and symbol tokens."""
+        tokens = []
+        pos = 0
+        expression_str = expression_str.rstrip()
+        while pos < len(expression_str):
+            match = TOKEN_REGEX.match(expression_str, pos)
+            if match is None:
+                raise ValueError(f"Cannot tokenize expression: {expression_str!r}")
+            number, symbol = match.groups()
+            if symbol is not None and symbol not in "+-*/^()":
+                raise ValueError(f"Unexpected character {symbol!r} in expression: {expression_str!r}")
+            tokens.append(number if number is not None else symbol)
+            pos = match.end()
+        return tokens
+    def to_rational(self, number_str):
+        """Convert a number literal to a Fraction.
+
+        Integer literals are exact. In the "float" mode decimal literals are
+        read as sympy reads them, as a FloatValue rounded to the precision of
+        their number of significant digits (at least 15), so that results on
+        the float-valued intermediate steps match the sympy based pipeline;
+        the other modes read them exactly.
+        """
+        if number_str.isdigit():
+            return Fraction(int(number_str))
+        if self.numeric_mode != "float":
+            return Fraction(number_str)
+        if "." not in number_str:
+            value = Fraction(number_str)
+            # sympy reads "12e3" as an integer too
+            if value.denominator == 1:
+                return value
+        mantissa, __, exponent = number_str.lower().partition("e")
+        integer_part, __, fraction_part = mantissa.partition(".")
+        digits = integer_part + fraction_part
+        num_digits = len(digits.lstrip("0"))
+        if num_digits <= MIN_FLOAT_DIGITS:
+            # 53 bits: float() rounds to exactly that
+            return FloatValue(*float(number_str).as_integer_ratio(), DOUBLE_BITS)
+        prec = digits_to_bits(num_digits)
+        scale = int(exponent or 0) - len(fraction_part)
+        if scale >= 0:
+            return FloatValue(*round_ratio(int(digits) * 10 ** scale, 1, prec), prec)
+        return FloatValue(*round_ratio(int(digits), 10 ** -scale, prec), prec)
+    def __float_operation(self, operator, lhs, rhs):
+        """lhs operator rhs for one of + - * / when an operand is a FloatValue,
+        rounded the way sympy rounds operations on Floats."""
+        if operator == "/":
+            if rhs == 0:
+                raise UndefinedResult("division by zero")
+            if type(lhs) is not FloatValue:
+                # sympy divides a Rational by a Float as lhs * (1 / rhs)
+                sign = -1 if rhs < 0 else 1
+                reciprocal = round_ratio(sign * rhs.denominator, sign * rhs.numerator, rhs.prec)
+                return self.__float_operation("*", lhs, FloatValue(*reciprocal, rhs.prec))
+        # The exact operand is rounded to the precision of the Float, and the
+        # result to the larger precision of the two; the arithmetic is done on
+        # numerators and denominators, without intermediate Fractions
+        prec = max(getattr(lhs, "prec", 0), getattr(rhs, "prec", 0))
+        lhs_numerator, lhs_denominator = round_ratio(lhs.numerator, lhs.denominator, prec)
+        rhs_numerator, rhs_denominator = round_ratio(rhs.numerator, rhs.denominator, prec)
+        if operator == "+":
+            numerator = lhs_numerator * rhs_denominator + rhs_numerator * lhs_denominator
+            denominator = lhs_denominator * rhs_denominator
+        elif operator == "-":
+            numerator = lhs_numerator * rhs_denominator - rhs_numerator * lhs_denominator
+            denominator = lhs_denominator * rhs_denominator
+        elif operator == "*":
+            numerator = lhs_numerator * rhs_numerator
+            denominator = lhs_denominator * rhs_denominator
+        else:
+            numerator = lhs_numerator * rhs_denominator
+            denominator = lhs_denominator * rhs_numerator
+            if denominator < 0:
+                numerator, denominator = -numerator, -denominator
+        return FloatValue(*round_ratio(numerator, denominator, prec), prec)
+    def __parse_sum(self, tokens, pos):
+        value, pos = self.__parse_product(tokens, pos)
+        while pos < len(tokens) and tokens[pos] in ("+", "-"):
+            operator = tokens[pos]
+            rhs, pos = self.__parse_product(tokens, pos + 1)
+            if type(value) is FloatValue or type(rhs) is FloatValue:
+                value = self.__float_operation(operator, value, rhs)
+            else:
+                value = value + rhs if operator == "+" else value - rhs
+        return value, pos
+    def __parse_product(self, tokens, pos):
+        value, pos = self.__parse_unary(tokens, pos)
+        while pos < len(tokens) and tokens[pos] in ("*", "/"):
+            operator = tokens[pos]
+            rhs, pos = self.__parse_unary(tokens, pos + 1)
+            if type(value) is FloatValue or type(rhs) is FloatValue:
+                value = self.__float_operation(operator, value, rhs)
+            elif operator == "*":
+                value = value * rhs
+            elif rhs == 0:
+                raise UndefinedResult("division by zero")
+            else:
+                value = value / rhs
+        return value, pos
+    def __parse_unary(self, tokens, pos):
+        # Unary signs bind more loosely than exponentiation, so -2^2 is -(2^2)
+        if pos < len(tokens) and tokens[pos] in ("+", "-"):
+            value, next_pos = self.__parse_unary(tokens, pos + 1)
+            if tokens[pos] == "+":
+                return value, next_pos
+            # Negation is exact, so a FloatValue keeps its precision
+            if type(value) is FloatValue:
+                return FloatValue(-value.numerator, value.denominator, value.prec), next_pos
+            return -value, next_pos
+        return self.__parse_power(tokens, pos)
+    def __parse_power(self, tokens, pos):
+        base, pos = self.__parse_atom(tokens, pos)
+        if pos < len(tokens) and tokens[pos] == "^":
+            # '^' is right associative and its exponent may carry a sign
+            exponent, pos = self.__parse_unary(tokens, pos + 1)
+            return self.__power(base, exponent), pos
+        return base, pos
+    def __parse_atom(self, tokens, pos):
+        if pos >= len(tokens):
+            raise ValueError("Unexpected end of expression")
+        token = tokens[pos]
+        if token == "(":
+            value, pos = self.__parse_sum(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos] != ")":
+                raise ValueError("Unbalanced parentheses in expression")
+            return value, pos + 1
+        if token in "+-*/^)":
+            raise ValueError(f"Unexpected token {token!r} in expression")
+        return self.to_rational(token), pos + 1
+    def __power(self, base, exponent):
+        is_float = type(base) is FloatValue or type(exponent) is FloatValue
+        if exponent.denominator == 1:
+            if base == 0 and exponent < 0:
+                raise UndefinedResult("zero raised to a negative power")
+            if not is_float or exponent == 0 and type(exponent) is not FloatValue:
+                return base ** exponent.numerator
+            return self.__float_power(base, exponent.numerator,
+                                      max(getattr(base, "prec", 0), getattr(exponent, "prec", 0)))
+        # Non-integer exponents can only be approximated; negative bases have
+        # no real result
+        if base < 0:
+            raise UndefinedResult("negative base raised to a fractional power")
+        result = float(base) ** float(exponent)
+        if not math.isfinite(result):
+            raise UndefinedResult("non-finite power")
+        if not is_float:
+            return Fraction(result)
+        prec = max(getattr(base, "prec", 0), getattr(exponent, "prec", 0))
+        return FloatValue.rounded(Fraction(result), prec)
+    def __float_power(self, base, exponent, prec):
+        # An integer power of a Float, rounded as mpmath's mpf_pow_int does:
+        # once, except for negative powers other than -1, whose magnitude is
+        # rounded to prec + 5 bits before it is inverted
+        base = FloatValue.rounded(base, prec)
+        if exponent == 1 or base == 0:
+            return base
+        if exponent >= -1:
+            return FloatValue.rounded(base ** exponent, prec)
+        return FloatValue.rounded(1 / FloatValue.rounded(base ** -exponent, prec + 5), prec)
+    def evaluate(self, expression_str):
+        """Return the exact value of an expression as a Fraction, or None if it is undefined.
+
+        Malformed expressions raise ValueError.
+        """
+        tokens = self.tokenize(expression_str)
+        try:
+            value, pos = self.__parse_sum(tokens, 0)
+        except UndefinedResult:
+            return None
+        if pos != len(tokens):
+            raise ValueError(f"Unexpected token {tokens[pos]!r} in expression: {expression_str!r}")
+        return value
+    def format_result(self, value):
+        """Format a value for the numeric mode: the same way as str(float(...))
+        on a sympy result ("float"), exactly ("fraction") or rounded to
+        decimal_places ("decimal"). Only "float" can produce scientific notation."""
+        if self.numeric_mode == "float":
+            # evalf() rounds Floats to 53 bits, and exact results too after
+            # truncating them to 57 bits; the division is then exact
+            numerator, denominator = value.numerator, value.denominator
+            if type(value) is not FloatValue:
+                numerator, denominator = round_ratio(numerator, denominator, DOUBLE_BITS + EVALF_GUARD_BITS,
+                                                     toward_zero=True)
+            numerator, denominator = round_ratio(numerator, denominator, DOUBLE_BITS)
+            return str(numerator / denominator)
+        if self.numeric_mode == "fraction":
+            return self.__format_exact(value)
+        return self.__format_rounded(value)
+    def __format_exact(self, value):
+        # A fraction has a finite decimal expansion if and only if its reduced
+        # denominator has no prime factors other than 2 and 5
+        denominator = value.denominator
+        num_twos = (denominator & -denominator).bit_length() - 1
+        denominator >>= num_twos
+        num_fives = 0
+        while denominator % 5 == 0:
+            denominator //= 5
+            num_fives += 1
+        if denominator != 1:
+            raise ValueError(f"{value} has no exact decimal form; use the decimal numeric mode "
+                             "or generate expressions with exact division")
+        num_places = max(num_twos, num_fives)
+        if num_places == 0:
+            return str(value.numerator)
+        digits = abs(value.numerator) * 10 ** num_places // value.denominator
+        sign = "-" if value < 0 else ""
+        return f"{sign}{digits // 10 ** num_places}.{digits % 10 ** num_places:0{num_places}d}"
+    def __format_rounded(self, value):
+        # Truncate to one digit past the last kept place, with that digit
+        # standing for the discarded remainder (0: none, 1: under half, 5:
+        # exactly half, 9: over half), so quantize rounds the exact value once
+        scaled = abs(value) * 10 ** self.decimal_places
+        truncated, remainder = divmod(scaled.numerator, scaled.denominator)
+        if remainder == 0:
+            sticky_digit = 0
+        elif 2 * remainder == scaled.denominator:
+            sticky_digit = 5
+        else:
+            sticky_digit = 1 if 2 * remainder < scaled.denominator else 9
+        digits = str(truncated * 10 + sticky_digit)
+        result = decimal.Decimal((1 if value < 0 else 0, tuple(map(int, digits)), -self.decimal_places - 1))
+        # The default context holds 28 digits, too few for large values; this
+        # one holds every digit, so quantize is exact but for the rounding
+        context = decimal.Context(prec=len(digits) + 1, rounding=self.rounding)
+        result = result.quantize(self.__quantum, context=context)
+        # Never render a negative zero
+        if result == 0:
+            result = abs(result)
+        return format(result, "f")
+    def agrees_with_sympy(self, expression_str, value, abs_tol=1e-06):
+        """Optional cross-check of a computed value against sympy (imported lazily)."""
+        import sympy as sp
+        sympy_value = sp.sympify(expression_str).evalf()
+        if value is None:
+            return not sympy_value.is_finite
+        return math.isclose(float(sympy_value), float(value), rel_tol=1e-09, abs_tol=abs_tol)
+
+
+def main():
+    # Check the decimal mode against Decimal division at ample precision,
+    # including values beyond the 28 digits of the default decimal context
+    import random
+    rng = random.Random(0)
+    values = [Fraction(10 ** 22), Fraction(-10 ** 40, 3), Fraction(99 ** 12), Fraction(2, 3), Fraction(-1, 8), Fraction(-1, 10 ** 8)]
+    values += [Fraction(rng.randint(-10 ** 30, 10 ** 30), rng.randint(1, 10 ** 6)) for __ in range(2000)]
+    num_wrong = 0
+    for rounding in ROUNDING_MODES:
+        rational_eval = RationalEvaluator("decimal", 6, rounding)
+        context = decimal.Context(prec=200, rounding=rounding)
+        for value in values:
+            expected = context.divide(decimal.Decimal(value.numerator), decimal.Decimal(value.denominator))
+            expected = expected.quantize(decimal.Decimal("1e-6"), context=context)
+            expected = format(abs(expected) if expected.is_zero() else expected, "f")
+            if rational_eval.format_result(value) != expected:
+                num_wrong += 1
+                print("wrong:", value, rounding, rational_eval.format_result(value), expected)
+    print("99^12 in decimal mode:", RationalEvaluator("decimal").format_result(
+        RationalEvaluator("decimal").evaluate(" * ".join(["99"] * 12))))
+    print("All decimal results correct:", num_wrong == 0)
+
+if __name__ == "__main__":
+    main()
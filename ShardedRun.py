@@ -0,0 +1,201 @@
+###############################################################################
+## Description: Runs dataset generation and processing as a set of shards    ##
+##              described by a manifest. Every shard draws from its own seed ##
+##              derived from one master SeedSequence, is committed to disk   ##
+##              atomically, and is skipped when a run is restarted, so the   ##
+##              merged output is bit-identical whether it was produced in    ##
+##              one go, resumed after a failure, or spread across hosts.     ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from DatasetGenerator import ExpressionGenerator
+from ExpressionEvaluator import ExpressionEvaluator
+from DatasetWriter import JsonlDatasetWriter
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+def write_atomically(path, data):
+    """Write bytes to path via a temporary file and a rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_manifest(run_dir, master_seed, num_shards, samples_per_shard, generator_kwargs=None,
+                    evaluator_kwargs=None, constructive=False, exact_division=False):
+    """Create a run directory with its manifest. Re-creating an identical
+    manifest is a no-op; a different one for the same directory is refused."""
+    manifest = {"version": MANIFEST_VERSION,
+                "master_seed": master_seed,
+                "num_shards": num_shards,
+                "samples_per_shard": samples_per_shard,
+                "generator": generator_kwargs or {},
+                "evaluator": {"whitespace_amount": 1, **(evaluator_kwargs or {})},
+                "constructive": constructive,
+                "exact_division": exact_division}
+    os.makedirs(os.path.join(run_dir, "shards"), exist_ok=True)
+    path = os.path.join(run_dir, MANIFEST_NAME)
+    data = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            if file.read() != data:
+                raise ValueError(f"{path} already exists with a different configuration")
+        return manifest
+    write_atomically(path, data)
+    return manifest
+
+class ShardedRun:
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        manifest_path = os.path.join(run_dir, MANIFEST_NAME)
+        with open(manifest_path, "rb") as file:
+            data = file.read()
+        self.manifest = json.loads(data)
+        if self.manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version: {self.manifest.get('version')!r}")
+        # Committed shards record the manifest they were made from
+        self.manifest_sha256 = hashlib.sha256(data).hexdigest()
+        self.num_shards = self.manifest["num_shards"]
+    def shard_path(self, shard_index):
+        return os.path.join(self.run_dir, "shards", f"shard-{shard_index:05d}.jsonl")
+    def marker_path(self, shard_index):
+        return self.shard_path(shard_index) + ".done"
+    def shard_seed(self, shard_index):
+        """Seed of a shard: the shard_index-th child of the master SeedSequence
+        (the same as SeedSequence(master_seed).spawn(num_shards)[shard_index])."""
+        return np.random.SeedSequence(self.manifest["master_seed"], spawn_key=(shard_index,))
+    def is_complete(self, shard_index):
+        """A shard is complete once its data file and a marker written for this manifest exist."""
+        try:
+            with open(self.marker_path(shard_index), encoding="utf-8") as file:
+                marker = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if marker.get("manifest_sha256") != self.manifest_sha256:
+            raise ValueError(f"Shard {shard_index} was produced from a different manifest")
+        return os.path.exists(self.shard_path(shard_index))
+    def pending_shards(self, shard_indices=None):
+        shard_indices = range(self.num_shards) if shard_indices is None else shard_indices
+        return [shard_index for shard_index in shard_indices if not self.is_complete(shard_index)]
+    def run_shard(self, shard_index, num_workers=1):
+        """Generate, process and commit one shard. Its data file is written
+        under a temporary name and renamed into place, then the marker is
+        written, so an interrupted shard is simply redone."""
+        generator = ExpressionGenerator(**self.manifest["generator"])
+        rng = np.random.default_rng(self.shard_seed(shard_index))
+        raw_dataset = dict(enumerate(generator.generate_iter(
+            num_samples=self.manifest["samples_per_shard"], rng=rng,
+            constructive=self.manifest["constructive"], exact_division=self.manifest["exact_division"])))
+        evaluator = ExpressionEvaluator(raw_dataset, **self.manifest["evaluator"])
+        path = self.shard_path(shard_index)
+        tmp_path = path + ".tmp"
+        with JsonlDatasetWriter(tmp_path, resume=False) as writer:
+            evaluator.process_dataset(num_workers=num_workers, sink=writer)
+        os.replace(tmp_path, path)
+        marker = {"manifest_sha256": self.manifest_sha256,
+                  "num_samples": writer.num_written,
+                  "failed_samples": evaluator.failed_samples,
+                  "sha256": file_sha256(path)}
+        write_atomically(self.marker_path(shard_index), json.dumps(marker, indent=2, sort_keys=True).encode())
+        return marker
+    def run(self, shard_indices=None, num_workers=1, progress_callback=None):
+        """Run every pending shard (or the pending ones of shard_indices, e.g.
+        this host's share), skipping the ones already committed."""
+        pending = self.pending_shards(shard_indices)
+        for num_done, shard_index in enumerate(pending, 1):
+            self.run_shard(shard_index, num_workers)
+            if progress_callback is not None:
+                progress_callback(shard_index, num_done, len(pending))
+        return pending
+    def merge(self, output_path):
+        """Concatenate the shards in shard order into one JSONL file, keeping
+        the first occurrence of any expression repeated across shards. Lines
+        are copied verbatim so the output only depends on the manifest."""
+        pending = self.pending_shards()
+        if pending:
+            raise ValueError(f"Cannot merge: {len(pending)} shards are not complete (first: {pending[0]})")
+        seen = set()
+        num_written = 0
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as output:
+            for shard_index in range(self.num_shards):
+                with open(self.shard_path(shard_index), "rb") as shard:
+                    for line in shard:
+                        expression = json.loads(line)["expression"]
+                        if expression in seen:
+                            continue
+                        seen.add(expression)
+                        output.write(line)
+                        num_written += 1
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(tmp_path, output_path)
+        return num_written
+
+def host_shards(num_shards, host_index, num_hosts):
+    """The shards run by one of num_hosts hosts (round robin)."""
+    return list(range(host_index, num_shards, num_hosts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manifest driven, resumable dataset generation.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    init_parser = subparsers.add_parser("init", help="create a run directory and its manifest")
+    init_parser.add_argument("run_dir")
+    init_parser.add_argument("--seed", type=int, required=True)
+    init_parser.add_argument("--num-shards", type=int, required=True)
+    init_parser.add_argument("--samples-per-shard", type=int, required=True)
+    init_parser.add_argument("--min-value", type=int, default=1)
+    init_parser.add_argument("--max-value", type=int, default=100)
+    init_parser.add_argument("--max-nesting", type=int, default=3)
+    init_parser.add_argument("--whitespace-amount", type=int, default=1)
+    init_parser.add_argument("--engine", default="string")
+    init_parser.add_argument("--constructive", action="store_true")
+    init_parser.add_argument("--exact-division", action="store_true")
+    run_parser = subparsers.add_parser("run", help="run the pending shards")
+    run_parser.add_argument("run_dir")
+    run_parser.add_argument("--host-index", type=int, default=0)
+    run_parser.add_argument("--num-hosts", type=int, default=1)
+    run_parser.add_argument("--num-workers", type=int, default=1)
+    status_parser = subparsers.add_parser("status", help="list the pending shards")
+    status_parser.add_argument("run_dir")
+    merge_parser = subparsers.add_parser("merge", help="merge the completed shards")
+    merge_parser.add_argument("run_dir")
+    merge_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        create_manifest(args.run_dir, args.seed, args.num_shards, args.samples_per_shard,
+                        {"min_value": args.min_value, "max_value": args.max_value, "max_nesting": args.max_nesting},
+                        {"whitespace_amount": args.whitespace_amount, "engine": args.engine},
+                        args.constructive, args.exact_division)
+        return
+    run = ShardedRun(args.run_dir)
+    if args.command == "run":
+        run.run(host_shards(run.num_shards, args.host_index, args.num_hosts), args.num_workers,
+                lambda shard_index, num_done, total: print(f"shard {shard_index} done ({num_done}/{total})"))
+    elif args.command == "status":
+        pending = run.pending_shards()
+        print(f"{run.num_shards - len(pending)}/{run.num_shards} shards complete")
+        if pending:
+            print("pending:", " ".join(map(str, pending)))
+    elif args.command == "merge":
+        print("samples written:", run.merge(args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+###############################################################################
+## Description: Local asyncio server generating expressions and their eval  ##
+##              steps on demand, next to a training loop. Clients connect    ##
+##              over TCP or a Unix socket and send one JSON line asking for  ##
+##              N samples of a given generator/evaluator config; the server  ##
+##              gathers concurrent requests into micro-batches per config,   ##
+##              runs them on a pool of worker processes and streams the      ##
+##              records back as JSON lines as soon as each batch is done.    ##
+##              Bounded queues give backpressure, and prefetch_depth sets    ##
+##              how many batches are in flight at once.                      ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from DatasetGenerator import ExpressionGenerator
+from ExpressionEvaluator import ExpressionEvaluator
+from DatasetWriter import to_record
+
+# Config keys a client may set; anything else is refused
+GENERATOR_KEYS = ("min_value", "max_value", "operators", "max_nesting")
+EVALUATOR_KEYS = ("whitespace_amount", "engine", "numeric_mode", "decimal_places", "rounding")
+DEFAULT_CONFIG = {"generator": {}, "evaluator": {"whitespace_amount": 1},
+                  "constructive": False, "exact_division": False}
+MAX_LINE_LENGTH = 1 << 16
+# Rounds of generation a batch gets to replace samples that failed to
+# process, and the most samples a round generates per missing sample, so a
+# config whose samples (nearly) always fail cannot loop forever
+MAX_REFILL_ROUNDS = 8
+MAX_OVERSAMPLING = 16
+
+def normalize_config(config):
+    """Validate a client config and fill in the defaults. Returns the config
+    and its canonical JSON form, used to group requests into batches."""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    unknown = set(config) - set(DEFAULT_CONFIG) | \
+              set(config["generator"]) - set(GENERATOR_KEYS) | \
+              set(config["evaluator"]) - set(EVALUATOR_KEYS)
+    if unknown:
+        raise ValueError(f"Unsupported config keys: {', '.join(sorted(unknown))}")
+    config["evaluator"] = {**DEFAULT_CONFIG["evaluator"], **config["evaluator"]}
+    return config, json.dumps(config, sort_keys=True)
+
+# Per-process generators and evaluators, keyed by canonical config
+worker_pipelines = {}
+
+def generate_batch(config_key, num_samples, seed):
+    """Generate and process num_samples samples in a worker process. Returns
+    the records of the processed samples and the number that failed."""
+    if config_key not in worker_pipelines:
+        config = json.loads(config_key)
+        worker_pipelines[config_key] = (ExpressionGenerator(**config["generator"]),
+                                        ExpressionEvaluator({}, **config["evaluator"]), config)
+    generator, evaluator, config = worker_pipelines[config_key]
+    raw_samples = generator.generate_iter(num_samples=num_samples, rng=np.random.default_rng(seed),
+                                          constructive=config["constructive"],
+                                          exact_division=config["exact_division"])
+    records = []
+    num_failed = 0
+    for raw_sample in raw_samples:
+        raw_sample, processed_sample, error = evaluator.process_sample_safely(raw_sample)
+        if error is None:
+            records.append(to_record(raw_sample, processed_sample))
+        else:
+            num_failed += 1
+    return records, num_failed
+
+class Job:
+    """Part of a client request, at most max_batch_size samples, whose
+    results go to the output queue of its request."""
+    __slots__ = ("config_key", "num_samples", "output")
+    def __init__(self, config_key, num_samples, output):
+        self.config_key = config_key
+        self.num_samples = num_samples
+        self.output = output
+
+class StepServer:
+    def __init__(self, num_workers=2, max_batch_size=1024, max_delay=0.005, prefetch_depth=2,
+                 max_queue_size=256, seed=None):
+        if max_batch_size < 1 or prefetch_depth < 1 or max_queue_size < 1:
+            raise ValueError("max_batch_size, prefetch_depth and max_queue_size must be positive")
+        self.num_workers = num_workers
+        # A batch is dispatched once it holds max_batch_size samples or its
+        # first job has waited max_delay seconds
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        # Number of batches being generated at once; keeping more batches in
+        # flight than workers means the next batch is ready when one finishes
+        self.prefetch_depth = prefetch_depth
+        # Jobs waiting to be batched before clients are made to wait, and jobs
+        # of one request that may be queued or finished but not yet sent
+        self.max_queue_size = max_queue_size
+        # Batch seeds are spawned from one SeedSequence, so no two batches
+        # share a random stream
+        self.__seed_sequence = np.random.SeedSequence(seed)
+        self.__jobs = None
+        self.__executor = None
+        self.__in_flight = None
+        self.__batcher = None
+        # Running batch tasks, referenced so they are not garbage collected
+        self.__batch_tasks = set()
+        self.num_batches = 0
+    async def __aenter__(self):
+        self.__jobs = asyncio.Queue(self.max_queue_size)
+        self.__in_flight = asyncio.Semaphore(self.prefetch_depth)
+        # Forked workers would inherit the sockets of the clients connected at
+        # the time and keep them open after the server closes them
+        self.__executor = ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.__batcher = asyncio.create_task(self.__batch_jobs())
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.__batcher.cancel()
+        self.__executor.shutdown(cancel_futures=True)
+    async def __batch_jobs(self):
+        """Collect queued jobs into per-config micro-batches and dispatch them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.__jobs.get()]
+            deadline = loop.time() + self.max_delay
+            num_samples = jobs[0].num_samples
+            while num_samples < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self.__jobs.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                jobs.append(job)
+                num_samples += job.num_samples
+            batches = {}
+            for job in jobs:
+                batches.setdefault(job.config_key, []).append(job)
+            for config_key, batch_jobs in batches.items():
+                # Waiting here holds back the batcher, and through the bounded
+                # job queue the clients, while prefetch_depth batches are running
+                await self.__in_flight.acquire()
+                seed = self.__seed_sequence.spawn(1)[0]
+                task = asyncio.create_task(self.__run_batch(config_key, batch_jobs, seed))
+                self.__batch_tasks.add(task)
+                task.add_done_callback(self.__batch_tasks.discard)
+    async def __run_batch(self, config_key, jobs, seed):
+        try:
+            num_samples = sum(job.num_samples for job in jobs)
+            records = []
+            num_failed = 0
+            num_generated = num_samples
+            try:
+                # Samples that fail to process (e.g. results with no exact
+                # decimal form in the "fraction" mode) are replaced by more
+                # samples, as many as the success rate so far says are needed
+                for __ in range(MAX_REFILL_ROUNDS):
+                    batch_records, batch_failed = await asyncio.get_running_loop().run_in_executor(
+                        self.__executor, generate_batch, config_key, num_generated, seed)
+                    records += batch_records
+                    num_failed += batch_failed
+                    num_missing = num_samples - len(records)
+                    if num_missing <= 0:
+                        break
+                    num_attempted = len(records) + num_failed
+                    num_generated = min(-(-num_missing * num_attempted // max(len(records), 1)),
+                                        num_missing * MAX_OVERSAMPLING)
+                    seed = seed.spawn(1)[0]
+            except Exception as error:
+                for job in jobs:
+                    await job.output.put({"error": f"{type(error).__name__}: {error}"})
+                return
+            self.num_batches += 1
+        finally:
+            self.__in_flight.release()
+        # Hand each job its share, surplus samples being dropped; the failures
+        # are counted for every job of the batch, and only a config whose
+        # samples almost never process leaves jobs short
+        start = 0
+        for job in jobs:
+            await job.output.put({"records": records[start:start + job.num_samples], "num_failed": num_failed})
+            start += job.num_samples
+    async def __handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    num_samples = int(request["num_samples"])
+                    if num_samples < 0:
+                        raise ValueError("num_samples must not be negative")
+                    config, config_key = normalize_config(request.get("config"))
+                except (KeyError, TypeError, ValueError) as error:
+                    writer.write((json.dumps({"error": f"Bad request: {error}"}) + "\n").encode())
+                    await writer.drain()
+                    continue
+                await self.__serve_request(config_key, num_samples, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    async def __serve_request(self, config_key, num_samples, writer):
+        """Split a request into jobs and stream their records back as they finish,
+        ending with a line giving the number of samples sent and the number
+        that failed to process in the batches serving the request (those
+        were regenerated, but are reported)."""
+        # At most max_queue_size jobs of a request are queued or unsent at once,
+        # so a slow client holds back its own jobs rather than piling up results
+        window = asyncio.Semaphore(self.max_queue_size)
+        output = asyncio.Queue()
+        job_sizes = [min(self.max_batch_size, num_samples - start)
+                     for start in range(0, num_samples, self.max_batch_size)]
+        async def submit():
+            for job_size in job_sizes:
+                await window.acquire()
+                await self.__jobs.put(Job(config_key, job_size, output))
+        submitter = asyncio.create_task(submit())
+        num_sent = 0
+        num_failed = 0
+        errors = []
+        try:
+            for __ in job_sizes:
+                result = await output.get()
+                if "error" in result:
+                    errors.append(result["error"])
+                else:
+                    writer.write("".join(json.dumps(record) + "\n" for record in result["records"]).encode())
+                    num_sent += len(result["records"])
+                    num_failed += result["num_failed"]
+                    await writer.drain()
+                window.release()
+        finally:
+            submitter.cancel()
+        summary = {"done": True, "num_samples": num_sent, "num_failed": num_failed}
+        if errors:
+            summary["errors"] = errors
+        writer.write((json.dumps(summary) + "\n").encode())
+        await writer.drain()
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        """Serve forever on a Unix socket if path is given, otherwise on host:port."""
+        if path is not None:
+            server = await asyncio.start_unix_server(self.__handle_client, path, limit=MAX_LINE_LENGTH)
+        else:
+            server = await asyncio.start_server(self.__handle_client, host, port, limit=MAX_LINE_LENGTH)
+        async with server:
+            await server.serve_forever()
+
+async def request_samples(num_samples, config=None, host="127.0.0.1", port=8765, path=None):
+    """Client side: ask a StepServer for num_samples samples and yield the
+    (raw sample, processed sample) pairs as they arrive. Raises RuntimeError
+    at the end if the server could not produce all of them."""
+    from DatasetWriter import from_record
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=1 << 24)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 24)
+    try:
+        writer.write((json.dumps({"num_samples": num_samples, "config": config or {}}) + "\n").encode())
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Server closed the connection before the request was done")
+            message = json.loads(line)
+            if "done" in message:
+                if "errors" in message:
+                    raise RuntimeError(f"Server failed to generate samples: {message['errors'][0]}")
+                if message["num_samples"] < num_samples:
+                    raise RuntimeError(f"Server sent {message['num_samples']} of {num_samples} samples; "
+                                       f"{message['num_failed']} samples failed to process")
+                return
+            if "error" in message:
+                raise ValueError(message["error"])
+            yield from_record(message)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve generated expressions and eval steps over a socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="serve on this Unix socket path instead of TCP")
+    parser.add_argument("--num-workers", type=int, default=2)
+    parser.add_argument("--max-batch-size", type=int, default=1024)
+    parser.add_argument("--max-delay", type=float, default=0.005, help="seconds to wait to fill a batch")
+    parser.add_argument("--prefetch-depth", type=int, default=2, help="batches generated at once")
+    parser.add_argument("--max-queue-size", type=int, default=256)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    async def serve():
+        async with StepServer(args.num_workers, args.max_batch_size, args.max_delay, args.prefetch_depth,
+                              args.max_queue_size, args.seed) as server:
+            await server.serve(args.host, args.port, args.unix_socket)
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
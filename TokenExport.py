@@ -0,0 +1,200 @@
+###############################################################################
+## Description: Exports processed samples as pre-tokenized integer arrays so ##
+##              training data loaders do not re-tokenize every epoch. Each   ##
+##              sample (its expression followed by its eval steps) is mapped ##
+##              through a small fixed vocabulary and appended to one flat    ##
+##              token file, with offset files indexing samples and steps.    ##
+##              The export streams; the files are read back as np.memmap so  ##
+##              per-sample and per-step slices are zero-copy views.          ##
+## Last Modified: 17 October 2026                                            ##
+###############################################################################
+
+import argparse
+import json
+import os
+import numpy as np
+from DatasetWriter import iter_dataset
+
+EXPORT_VERSION = 1
+# Token ID -> symbol. PAD is never written but gives loaders an ID to pad with;
+# SEP separates the expression and consecutive steps, EOS ends a sample
+SPECIAL_TOKENS = ["<pad>", "<sep>", "<eos>"]
+VOCABULARY = SPECIAL_TOKENS + list("0123456789.-+*/^() ")
+PAD_ID, SEP_ID, EOS_ID = range(len(SPECIAL_TOKENS))
+TOKEN_DTYPE = np.uint8
+OFFSET_DTYPE = np.int64
+# Byte -> token ID table for bytes.translate, and the bytes in the vocabulary
+ENCODE_TABLE = bytes(VOCABULARY.index(chr(byte)) if chr(byte) in VOCABULARY[len(SPECIAL_TOKENS):] else 0
+                     for byte in range(256))
+SYMBOL_BYTES = "".join(VOCABULARY[len(SPECIAL_TOKENS):]).encode("ascii")
+DECODE_TABLE = np.array(VOCABULARY, dtype=object)
+
+TOKENS_FILE = "tokens.bin"
+SAMPLE_OFFSETS_FILE = "sample_offsets.bin"
+SEGMENT_OFFSETS_FILE = "segment_offsets.bin"
+SAMPLE_SEGMENTS_FILE = "sample_segments.bin"
+METADATA_FILE = "metadata.json"
+
+def encode(text):
+    """Token IDs (bytes) of a string made of vocabulary symbols only."""
+    data = text.encode("ascii", errors="replace")
+    if data.translate(None, SYMBOL_BYTES):
+        raise ValueError(f"Cannot tokenize {text!r}: it contains symbols outside the vocabulary")
+    return data.translate(ENCODE_TABLE)
+
+def decode(token_ids):
+    """Inverse of encode; special tokens are rendered by name."""
+    return "".join(DECODE_TABLE[np.asarray(token_ids, dtype=np.intp)])
+
+class TokenExporter:
+    """Streams samples into the flat token and offset files of out_dir.
+
+    tokens.bin holds every sample as expression <sep> step 0 <sep> ... <sep>
+    step n <eos>. sample_offsets.bin holds num_samples + 1 token offsets, and
+    segment_offsets.bin the token offset of every segment (the expression and
+    each step) plus a final end offset, and sample_segments.bin the index of
+    the first segment of every sample plus the total number of segments.
+    metadata.json is written last, by close; an export that raised before
+    closing has none, so TokenDataset refuses to open it.
+    """
+    def __init__(self, out_dir, buffer_size=1 << 20):
+        self.out_dir = out_dir
+        self.buffer_size = buffer_size
+        os.makedirs(out_dir, exist_ok=True)
+        # Metadata left by an earlier export would describe files about to be overwritten
+        metadata_path = os.path.join(out_dir, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+        self.__tokens_file = open(os.path.join(out_dir, TOKENS_FILE), "wb")
+        self.__sample_offsets_file = open(os.path.join(out_dir, SAMPLE_OFFSETS_FILE), "wb")
+        self.__segment_offsets_file = open(os.path.join(out_dir, SEGMENT_OFFSETS_FILE), "wb")
+        self.__sample_segments_file = open(os.path.join(out_dir, SAMPLE_SEGMENTS_FILE), "wb")
+        self.__tokens = bytearray()
+        self.__sample_offsets = []
+        self.__segment_offsets = []
+        self.__sample_segments = []
+        self.num_tokens = 0
+        self.num_samples = 0
+        self.num_segments = 0
+    def write(self, raw_sample, processed_sample):
+        """Append one sample in the format produced by process_dataset."""
+        self.__sample_offsets.append(self.num_tokens)
+        self.__sample_segments.append(self.num_segments)
+        segments = [raw_sample, *processed_sample["eval_steps"].values()]
+        for i, segment in enumerate(segments):
+            token_ids = encode(segment)
+            self.__segment_offsets.append(self.num_tokens)
+            self.__tokens += token_ids
+            self.__tokens.append(SEP_ID if i < len(segments) - 1 else EOS_ID)
+            self.num_tokens += len(token_ids) + 1
+        self.num_samples += 1
+        self.num_segments += len(segments)
+        if len(self.__tokens) >= self.buffer_size:
+            self.flush()
+    def flush(self):
+        self.__tokens_file.write(self.__tokens)
+        self.__sample_offsets_file.write(np.asarray(self.__sample_offsets, dtype=OFFSET_DTYPE).tobytes())
+        self.__segment_offsets_file.write(np.asarray(self.__segment_offsets, dtype=OFFSET_DTYPE).tobytes())
+        self.__sample_segments_file.write(np.asarray(self.__sample_segments, dtype=OFFSET_DTYPE).tobytes())
+        self.__tokens = bytearray()
+        self.__sample_offsets = []
+        self.__segment_offsets = []
+        self.__sample_segments = []
+    def close(self):
+        # Closing offsets, so sample i spans offsets[i]:offsets[i + 1]
+        self.__sample_offsets.append(self.num_tokens)
+        self.__segment_offsets.append(self.num_tokens)
+        self.__sample_segments.append(self.num_segments)
+        self.flush()
+        self.__close_files()
+        metadata = {"version": EXPORT_VERSION,
+                    "vocabulary": VOCABULARY,
+                    "token_dtype": np.dtype(TOKEN_DTYPE).name,
+                    "offset_dtype": np.dtype(OFFSET_DTYPE).name,
+                    "num_samples": self.num_samples,
+                    "num_segments": self.num_segments,
+                    "num_tokens": self.num_tokens}
+        metadata_path = os.path.join(self.out_dir, METADATA_FILE)
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(metadata, file, indent=2)
+        os.replace(metadata_path + ".tmp", metadata_path)
+    def abort(self):
+        """Close the files of a failed export without writing its metadata."""
+        self.__close_files()
+    def __close_files(self):
+        for file in (self.__tokens_file, self.__sample_offsets_file, self.__segment_offsets_file,
+                     self.__sample_segments_file):
+            file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def export_tokens(samples, out_dir):
+    """Tokenize (raw sample, processed sample) pairs (e.g. iter_dataset(path)
+    or process_dataset().items()) into out_dir. Returns the number of samples."""
+    with TokenExporter(out_dir) as exporter:
+        for raw_sample, processed_sample in samples:
+            exporter.write(raw_sample, processed_sample)
+    return exporter.num_samples
+
+class TokenDataset:
+    """Read-only, memory-mapped view of an export. Slices returned by sample,
+    segment and step are views of the token memmap, not copies."""
+    def __init__(self, out_dir):
+        if not os.path.exists(os.path.join(out_dir, METADATA_FILE)):
+            raise ValueError(f"{out_dir} is not a complete export: it has no {METADATA_FILE}")
+        with open(os.path.join(out_dir, METADATA_FILE), encoding="utf-8") as file:
+            self.metadata = json.load(file)
+        if self.metadata["version"] != EXPORT_VERSION or self.metadata["vocabulary"] != VOCABULARY:
+            raise ValueError(f"{out_dir} was exported with a different format or vocabulary")
+        self.tokens = self.__open(out_dir, TOKENS_FILE, self.metadata["token_dtype"])
+        self.sample_offsets = self.__open(out_dir, SAMPLE_OFFSETS_FILE, self.metadata["offset_dtype"])
+        self.segment_offsets = self.__open(out_dir, SEGMENT_OFFSETS_FILE, self.metadata["offset_dtype"])
+        self.sample_segments = self.__open(out_dir, SAMPLE_SEGMENTS_FILE, self.metadata["offset_dtype"])
+    def __open(self, out_dir, file_name, dtype):
+        path = os.path.join(out_dir, file_name)
+        # np.memmap cannot map an empty file
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+    def __len__(self):
+        return self.metadata["num_samples"]
+    def sample(self, index):
+        """Every token of a sample, separators and the closing <eos> included."""
+        return self.tokens[self.sample_offsets[index]:self.sample_offsets[index + 1]]
+    def num_steps(self, index):
+        return int(self.sample_segments[index + 1] - self.sample_segments[index]) - 1
+    def segment(self, index, segment_index):
+        """Tokens of one segment of a sample (0 is the expression, 1 the first
+        step, ...), without its trailing separator."""
+        num_segments = self.num_steps(index) + 1
+        if not 0 <= segment_index < num_segments:
+            raise IndexError(f"Sample {index} has no segment {segment_index}")
+        position = self.sample_segments[index] + segment_index
+        return self.tokens[self.segment_offsets[position]:self.segment_offsets[position + 1] - 1]
+    def expression(self, index):
+        return self.segment(index, 0)
+    def step(self, index, step_index):
+        return self.segment(index, step_index + 1)
+    def steps(self, index):
+        return [self.step(index, step_index) for step_index in range(self.num_steps(index))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a processed dataset as memory-mapped token arrays.")
+    parser.add_argument("dataset", help="JSONL file or Parquet directory written by a DatasetWriter")
+    parser.add_argument("out_dir")
+    args = parser.parse_args()
+
+    num_samples = export_tokens(iter_dataset(args.dataset), args.out_dir)
+    dataset = TokenDataset(args.out_dir)
+    print(f"exported {num_samples} samples, {dataset.metadata['num_tokens']} tokens to {args.out_dir}")
+    if num_samples:
+        print("sample 0:", decode(dataset.sample(0)))
+
+if __name__ == "__main__":
+    main()